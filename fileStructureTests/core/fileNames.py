@@ -5,10 +5,13 @@ reservedFileNames = "CON PRN AUX CLOCK$ NUL A:-Z: COM1".lower().split(" ")
 reservedFileNames += "LPT1 LPT2 LPT3 COM2 COM3 COM4".lower().split(" ")
 maxFileNameLength = 255
 
-def userNameToFileName(userName, existing=[], prefix="", suffix=""):
+_illegalCharacters = set(illegalCharacters)
+
+def userNameToFileName(userName, existing=[], prefix="", suffix="", counters=None):
 	"""
 	existing should be a case-insensitive list
-	of all existing file names.
+	of all existing file names. counters is passed
+	to handleClash1.
 
 	>>> userNameToFileName(u"a")
 	u'a'
@@ -64,11 +67,14 @@ def userNameToFileName(userName, existing=[], prefix="", suffix=""):
 	# if no prefix is to be added
 	if not prefix and userName[0] == ".":
 		userName = "_" + userName[1:]
-	# filter the user name
+	# filter the user name. every character is at least one
+	# character long after filtering, so the characters past
+	# the clipping length don't need to be filtered.
+	sliceLength = maxFileNameLength - prefixLength - suffixLength
 	filteredUserName = []
-	for character in userName:
+	for character in userName[:sliceLength]:
 		# replace illegal characters with _
-		if character in illegalCharacters:
+		if character in _illegalCharacters:
 			character = "_"
 		# add _ to all non-lower characters
 		elif character != character.lower():
@@ -76,7 +82,6 @@ def userNameToFileName(userName, existing=[], prefix="", suffix=""):
 		filteredUserName.append(character)
 	userName = "".join(filteredUserName)
 	# clip to 255
-	sliceLength = maxFileNameLength - prefixLength - suffixLength
 	userName = userName[:sliceLength]
 	# test for illegal files names
 	parts = []
@@ -88,15 +93,83 @@ def userNameToFileName(userName, existing=[], prefix="", suffix=""):
 	# test for clash
 	fullName = prefix + userName + suffix
 	if fullName.lower() in existing:
-		fullName = handleClash1(userName, existing, prefix, suffix)
+		fullName = handleClash1(userName, existing, prefix, suffix, counters)
 	# finished
 	return fullName
 
-def handleClash1(userName, existing=[], prefix="", suffix=""):
+class FileNameAllocator(object):
+
+	"""
+	This allocates unique file names for user names with
+	the user name to file name algorithm. The existing file
+	names are stored in a case-insensitive set and the clash
+	counter for each user name is remembered, so allocating
+	a name takes constant time regardless of the number of
+	existing names.
+
+	>>> allocator = FileNameAllocator([u"a_.glif"], suffix=".glif")
+	>>> allocator.allocate(u"A")
+	u'A_000000000000001.glif'
+	>>> allocator.allocate(u"a:")
+	u'a_000000000000002.glif'
+	>>> allocator.allocate(u"b")
+	u'b.glif'
+	>>> u"B.GLIF" in allocator
+	True
+	>>> len(allocator)
+	4
+	>>> allocator.add(u"b.glif")
+	>>> allocator.add(u"A_000000000000001.GLIF")
+	>>> len(allocator)
+	4
+	"""
+
+	def __init__(self, existing=[], prefix="", suffix=""):
+		self.prefix = prefix
+		self.suffix = suffix
+		self._existing = set()
+		self._counters = {}
+		for fileName in existing:
+			self.add(fileName)
+
+	def __len__(self):
+		"""
+		The number of file names that have been added.
+		"""
+		return len(self._existing)
+
+	def __contains__(self, fileName):
+		return fileName.lower() in self._existing
+
+	def add(self, fileName):
+		"""
+		Add a file name that was not allocated by this object.
+		"""
+		self._existing.add(fileName.lower())
+
+	def allocate(self, userName):
+		"""
+		Allocate a unique file name for the given user name.
+		"""
+		fileName = userNameToFileName(userName, self._existing, self.prefix, self.suffix, self._counters)
+		self.add(fileName)
+		return fileName
+
+def handleClash1(userName, existing=[], prefix="", suffix="", counters=None):
 	"""
 	existing should be a case-insensitive list
 	of all existing file names.
 
+	If counters is given, it must be a dict of form:
+
+		{
+			lower case user name : next counter
+		}
+
+	The search for a unique name will start at the stored
+	counter for the user name and the counter following
+	the found name will be stored.
+
 	>>> prefix = ("0" * 5) + "."
 	>>> suffix = "." + ("0" * 10)
 	>>> existing = ["a" * 5]
@@ -117,6 +190,14 @@ def handleClash1(userName, existing=[], prefix="", suffix=""):
 	>>> handleClash1(userName="A" * 5, existing=e,
 	...     prefix=prefix, suffix=suffix)
 	'00000.AAAAA000000000000001.0000000000'
+
+	>>> e = list(existing)
+	>>> counters = {"aaaaa" : 3}
+	>>> handleClash1(userName="A" * 5, existing=e,
+	...     prefix=prefix, suffix=suffix, counters=counters)
+	'00000.AAAAA000000000000003.0000000000'
+	>>> counters
+	{'aaaaa': 4}
 	"""
 	# if the prefix length + user name length + suffix length + 15 is at
 	# or past the maximum length, silce 15 characters off of the user name
@@ -129,6 +210,8 @@ def handleClash1(userName, existing=[], prefix="", suffix=""):
 	finalName = None
 	# try to add numbers to create a unique name
 	counter = 1
+	if counters is not None:
+		counter = counters.get(userName.lower(), 1)
 	while finalName is None:
 		name = userName + str(counter).zfill(15)
 		fullName = prefix + name + suffix
@@ -139,6 +222,8 @@ def handleClash1(userName, existing=[], prefix="", suffix=""):
 			counter += 1
 		if counter >= 999999999999999:
 			break
+	if counters is not None and finalName is not None:
+		counters[userName.lower()] = counter + 1
 	# if there is a clash, go to the next fallback
 	if finalName is None:
 		finalName = handleClash2(existing, prefix, suffix)
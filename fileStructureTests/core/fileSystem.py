@@ -2,7 +2,8 @@ from collections import OrderedDict
 from environment import ET
 from xmlUtilities import treeToString
 from plistTree import convertTreeToPlist, convertPlistToTree, plistHeader
-from fileNames import userNameToFileName
+from plistString import readPlistFromString, writePlistToString
+from fileNames import FileNameAllocator
 
 
 class FileSystemError(Exception): pass
@@ -40,10 +41,31 @@ class BaseFileSystem(object):
 
 	fileExtension = "base"
 
-	def __init__(self):
+	# If this is True, the data is stored as bytes and
+	# property lists and glyphs may be read and written
+	# without building trees.
+	storesBytes = True
+
+	# If this is True, glyphs are stored as data that can
+	# be read into and written from glyph objects without
+	# any XML. readGlyphObject and writeGlyphObject must
+	# be implemented.
+	storesGlyphObjects = False
+
+	# If this is True, XML data is written without
+	# indentation whitespace.
+	compact = False
+
+	def __init__(self, compact=None):
+		if compact is not None:
+			self.compact = compact
 		self._haveReadLayerStorageMapping = False
 		self._layerStorageMapping = OrderedDict()
 		self._glyphStorageMapping = {}
+		self._layerStorageMappingChanged = False
+		self._changedGlyphStorageMappings = set()
+		self._layerNameAllocator = None
+		self._glyphNameAllocators = {}
 		self._defaultLayerName = None
 
 	def close(self):
@@ -124,6 +146,14 @@ class BaseFileSystem(object):
 
 		Subclasses MUST NOT override this method.
 		"""
+		if self.storesBytes:
+			data = self.readBytesFromLocation(location)
+			if data is None:
+				return None
+			try:
+				return readPlistFromString(data)
+			except:
+				raise FileSystemError("The file %s could not be read." % location)
 		tree = self.readTreeFromLocation(location)
 		if tree is None:
 			return None
@@ -139,6 +169,9 @@ class BaseFileSystem(object):
 
 		Subclasses MUST NOT override this method.
 		"""
+		if self.storesBytes:
+			self.writeBytesToLocation(writePlistToString(data, compact=self.compact), location)
+			return
 		tree = convertPlistToTree(data)
 		self.writeTreeToLocation(tree, location, header=plistHeader)
 
@@ -188,7 +221,7 @@ class BaseFileSystem(object):
 
 		Subclasses MUST NOT override this method.
 		"""
-		return treeToString(tree, header)
+		return treeToString(tree, header, compact=self.compact)
 
 	# ---------------
 	# Top Level Files
@@ -315,13 +348,18 @@ class BaseFileSystem(object):
 
 	def writeLayerContents(self):
 		"""
-		Write the layer contents mapping.
+		Write the layer contents mapping. Nothing is
+		written if no layer has been added since the
+		mapping was read or written.
 
 		Subclasses MAY override this method.
 		"""
+		if not self._layerStorageMappingChanged:
+			return
 		data = self.getLayerStorageMapping()
 		data = [(k, v) for k, v in data.items()]
 		self.writePlistToLocation(data, "layercontents.plist")
+		self._layerStorageMappingChanged = False
 
 	def getLayerStorageMapping(self):
 		"""
@@ -348,14 +386,31 @@ class BaseFileSystem(object):
 		"""
 		layerStorageMapping = self.getLayerStorageMapping()
 		if layerName not in layerStorageMapping:
+			allocator = self._getLayerNameAllocator()
 			if layerName == self.getDefaultLayerName():
 				storageName = "glyphs"
+				allocator.add(storageName)
 			else:
 				layerName = unicode(layerName)
-				storageName = userNameToFileName(layerName, existing=layerStorageMapping.values(), prefix="glyphs.")
+				storageName = allocator.allocate(layerName)
 			layerStorageMapping[layerName] = storageName
+			self._layerStorageMappingChanged = True
 		return layerStorageMapping[layerName]
 
+	def _getLayerNameAllocator(self):
+		"""
+		Get the file name allocator for the layer names.
+		The allocator is built from the layer contents mapping
+		and it is kept between calls. The mapping is only
+		changed by getLayerStorageName, which adds the new
+		storage names to the allocator.
+		"""
+		allocator = self._layerNameAllocator
+		if allocator is None:
+			allocator = FileNameAllocator(self.getLayerStorageMapping().values(), prefix="glyphs.")
+			self._layerNameAllocator = allocator
+		return allocator
+
 	def getLayerNames(self):
 		"""
 		Get a list of all layer names, in order.
@@ -405,14 +460,42 @@ class BaseFileSystem(object):
 
 	def writeGlyphSetContents(self, layerName):
 		"""
-		Write the glyph set contents mapping for the given layer name.
+		Write the glyph set contents mapping for the given
+		layer name. Nothing is written if no glyph has been
+		added to the layer since the mapping was read or written.
 
 		Subclasses MAY override this method.
 		"""
+		if layerName not in self._changedGlyphStorageMappings:
+			return
 		layerDirectory = self.getLayerStorageName(layerName)
 		path = self.joinLocations(layerDirectory, "contents.plist")
 		data = self.getGlyphStorageMapping(layerName)
 		self.writePlistToLocation(data, path)
+		self._changedGlyphStorageMappings.discard(layerName)
+
+	def readGlyphSetMetadata(self, layerName):
+		"""
+		Read the glyph set metadata (see
+		UFOReaderWriter.readGlyphSetMetadata) for the
+		given layer name. This returns None if the layer
+		does not have any metadata.
+
+		Subclasses MAY override this method.
+		"""
+		layerDirectory = self.getLayerStorageName(layerName)
+		path = self.joinLocations(layerDirectory, "metadata.plist")
+		return self.readPlistFromLocation(path)
+
+	def writeGlyphSetMetadata(self, layerName, data):
+		"""
+		Write the glyph set metadata for the given layer name.
+
+		Subclasses MAY override this method.
+		"""
+		layerDirectory = self.getLayerStorageName(layerName)
+		path = self.joinLocations(layerDirectory, "metadata.plist")
+		self.writePlistToLocation(data, path)
 
 	def getGlyphStorageMapping(self, layerName):
 		"""
@@ -435,10 +518,48 @@ class BaseFileSystem(object):
 		"""
 		glyphStorageMapping = self.getGlyphStorageMapping(layerName)
 		if glyphName not in glyphStorageMapping:
-			storageName = userNameToFileName(unicode(glyphName), existing=glyphStorageMapping.values(), suffix=".glif")
+			allocator = self._getGlyphNameAllocator(layerName)
+			storageName = allocator.allocate(unicode(glyphName))
 			glyphStorageMapping[glyphName] = storageName
+			self._changedGlyphStorageMappings.add(layerName)
 		return glyphStorageMapping[glyphName]
 
+	def setGlyphStorageName(self, layerName, glyphName, storageName):
+		"""
+		Set the glyph storage name for the given layer name
+		and glyph name. This is for file systems that choose
+		their own storage names, for example file systems that
+		use the glyph names as storage names. The glyph set
+		contents mapping must only be changed with this method
+		or with getGlyphStorageName.
+
+		Subclasses MUST NOT override this method.
+		"""
+		glyphStorageMapping = self.getGlyphStorageMapping(layerName)
+		if glyphStorageMapping.get(glyphName) == storageName:
+			return
+		glyphStorageMapping[glyphName] = storageName
+		allocator = self._glyphNameAllocators.get(layerName)
+		if allocator is not None:
+			# a replaced storage name stays reserved
+			allocator.add(storageName)
+		self._changedGlyphStorageMappings.add(layerName)
+
+	def _getGlyphNameAllocator(self, layerName):
+		"""
+		Get the file name allocator for the given layer name.
+		The allocator is built from the glyph set contents
+		mapping and it is kept between calls. The mapping is
+		only changed by getGlyphStorageName and
+		setGlyphStorageName, which add the new storage names
+		to the allocator.
+		"""
+		allocator = self._glyphNameAllocators.get(layerName)
+		if allocator is None:
+			allocator = FileNameAllocator(self.getGlyphStorageMapping(layerName).values(), suffix=".glif")
+			self._glyphNameAllocators[layerName] = allocator
+		return allocator
+
 	def getGlyphNames(self, layerName):
 		"""
 		Get a list of glyph names for layer name.
@@ -447,6 +568,17 @@ class BaseFileSystem(object):
 		"""
 		return self.getGlyphStorageMapping(layerName).keys()
 
+	def getGlyphLocation(self, layerName, glyphName):
+		"""
+		Get the location of the glyph with the given
+		name in the layer with the given layer name.
+
+		Subclasses MUST NOT override this method.
+		"""
+		layerStorageName = self.getLayerStorageName(layerName)
+		glyphStorageName = self.getGlyphStorageName(layerName, glyphName)
+		return self.joinLocations(layerStorageName, glyphStorageName)
+
 	def readGlyph(self, layerName, glyphName):
 		"""
 		Read a glyph with the given name from the layer
@@ -454,12 +586,99 @@ class BaseFileSystem(object):
 
 		Subclasses MAY override this method.
 		"""
-		layerStorageName = self.getLayerStorageName(layerName)
-		glyphStorageName = self.getGlyphStorageName(layerName, glyphName)
-		path = self.joinLocations(layerStorageName, glyphStorageName)
+		path = self.getGlyphLocation(layerName, glyphName)
 		tree = self.readTreeFromLocation(path)
 		return tree
 
+	def readGlyphBytes(self, layerName, glyphName):
+		"""
+		Read the raw GLIF data of a glyph with the given
+		name from the layer with the given layer name.
+		This allows the data to be parsed without building
+		a tree. If the file system does not have the raw
+		data for the glyph, this will return None and the
+		glyph must be read with readGlyph.
+
+		Subclasses MAY override this method.
+		"""
+		path = self.getGlyphLocation(layerName, glyphName)
+		return self.readBytesFromLocation(path)
+
+	def readGlyphs(self, layerName, glyphNames):
+		"""
+		Read the glyphs with the given names from the
+		layer with the given layer name. This is a
+		generator of (glyph name, tree) tuples. The
+		glyphs may be yielded in any order.
+
+		Subclasses MAY override this method to read
+		many glyphs more efficiently than one at a time.
+		"""
+		for glyphName in glyphNames:
+			yield glyphName, self.readGlyph(layerName, glyphName)
+
+	def readGlyphsBytes(self, layerName, glyphNames):
+		"""
+		Read the raw GLIF data of the glyphs with the
+		given names from the layer with the given layer
+		name. This is a generator of (glyph name, data)
+		tuples. The glyphs may be yielded in any order.
+		As with readGlyphBytes, data will be None if the
+		file system does not have the raw data for a glyph.
+
+		Subclasses MAY override this method to read
+		many glyphs more efficiently than one at a time.
+		"""
+		for glyphName in glyphNames:
+			yield glyphName, self.readGlyphBytes(layerName, glyphName)
+
+	def readGlyphObject(self, layerName, glyphName, glyphObject, pointPen):
+		"""
+		Read a glyph with the given name from the layer with
+		the given layer name directly into the given glyph
+		object and point pen. This will only be called if
+		storesGlyphObjects is True.
+
+		Subclasses MUST override this method if
+		storesGlyphObjects is True.
+		"""
+		raise NotImplementedError
+
+	def readGlyphInfo(self, layerName, glyphName, fields):
+		"""
+		Read the given header fields (see UFOReaderWriter.readGlyphInfo)
+		of a glyph with the given name from the layer with the given
+		layer name and return a dict of form:
+
+			{
+				field : value
+			}
+
+		If the file system can't read the fields without
+		reading the entire glyph, this will return None.
+
+		Subclasses MAY override this method.
+		"""
+		return None
+
+	def findGlyphs(self, layerName, query):
+		"""
+		Find the glyphs in the layer with the given layer name
+		that match all criteria in the given query dict (see
+		UFOReaderWriter.findGlyphs) and return a list of
+		their names. The query dict is of form:
+
+			{
+				criterion : value
+			}
+
+		If the file system can't answer the query without
+		reading the glyphs, this will return None.
+
+		Subclasses MAY override this method.
+		"""
+		return None
+
 	def writeGlyph(self, layerName, glyphName, tree):
 		"""
 		Write a glyph with the given name to the layer
@@ -467,11 +686,76 @@ class BaseFileSystem(object):
 
 		Subclasses MAY override this method.
 		"""
-		layerStorageName = self.getLayerStorageName(layerName)
-		glyphStorageName = self.getGlyphStorageName(layerName, glyphName)
-		path = self.joinLocations(layerStorageName, glyphStorageName)
+		path = self.getGlyphLocation(layerName, glyphName)
 		self.writeTreeToLocation(tree, path)
 
+	def writeGlyphBytes(self, layerName, glyphName, data):
+		"""
+		Write a glyph with the given name to the layer
+		with the given layer name from the given raw GLIF
+		data. This allows the data to be written without
+		building a tree. This will only be called if
+		storesBytes is True.
+
+		Subclasses MAY override this method.
+		"""
+		path = self.getGlyphLocation(layerName, glyphName)
+		self.writeBytesToLocation(data, path)
+
+	def writeGlyphObject(self, layerName, glyphName, glyphObject):
+		"""
+		Write a glyph with the given name to the layer
+		with the given layer name directly from the given
+		glyph object. This will only be called if
+		storesGlyphObjects is True.
+
+		Subclasses MUST override this method if
+		storesGlyphObjects is True.
+		"""
+		raise NotImplementedError
+
+	def writeGlyphs(self, layerName, glyphs):
+		"""
+		Write the glyphs in the given iterable of
+		(glyph name, tree) tuples to the layer with
+		the given layer name as one batch. File systems
+		that support transactions will either write the
+		entire batch or, if an error occurs, none of it.
+
+		Subclasses MAY override this method to write
+		many glyphs more efficiently than one at a time.
+		"""
+		for glyphName, tree in glyphs:
+			self.writeGlyph(layerName, glyphName, tree)
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		"""
+		Write the glyphs in the given iterable of
+		(glyph name, raw GLIF data) tuples to the layer
+		with the given layer name as one batch. This has
+		the same contract as writeGlyphs. This will only
+		be called if storesBytes is True.
+
+		Subclasses MAY override this method to write
+		many glyphs more efficiently than one at a time.
+		"""
+		for glyphName, data in glyphs:
+			self.writeGlyphBytes(layerName, glyphName, data)
+
+	def writeGlyphObjects(self, layerName, glyphs):
+		"""
+		Write the glyphs in the given iterable of
+		(glyph name, glyph object) tuples to the layer
+		with the given layer name as one batch. This has
+		the same contract as writeGlyphs. This will only
+		be called if storesGlyphObjects is True.
+
+		Subclasses MAY override this method to write
+		many glyphs more efficiently than one at a time.
+		"""
+		for glyphName, glyphObject in glyphs:
+			self.writeGlyphObject(layerName, glyphName, glyphObject)
+
 
 # ---------
 # Debugging
@@ -554,7 +838,7 @@ def debugReadFont(fileSystemClass):
 	font.kerning = reader.readKerning()
 	font.lib = reader.readLib()
 	font.features = reader.readFeatures()
-	font.loadLayers(reader)
+	font.loadLayers(reader, loadGlyphs=True)
 	for layer in font.layers.values():
 		for glyph in layer:
 			pass
@@ -0,0 +1,464 @@
+"""
+GLIF reading and writing directly from and to strings.
+
+This reads GLIF data with expat and sends the parser
+events straight to the glyph object and point pen
+without building an intermediate element tree. The
+behavior is identical to reading from a tree with
+glyphTree.readGlyphFromTree.
+
+This writes GLIF data by formatting the glyph data
+straight into strings. The output is identical to
+writing a tree with glyphTree.writeGlyphToTree and
+serializing it with xmlUtilities.treeToString.
+"""
+
+from itertools import izip
+from xml.parsers import expat
+from plistString import PlistBuilder, writeObjectToStream
+from glyphTree import GlyphTreeError, _relaxedSetattr, _number, _transformationInfo, _stringAttributes, _getPointData
+from xmlUtilities import escapeText, escapeAttribute, decodeString
+
+# -------------
+# Glyph Reading
+# -------------
+
+def readGlyphFromString(data, glyphObject=None, pointPen=None, formatVersions=(2)):
+	readGlyphFromStringFormat2(data=data, glyphObject=glyphObject, pointPen=pointPen)
+
+def readGlyphFromStringFormat2(data, glyphObject=None, pointPen=None):
+	parser = _GlyphParser(glyphObject, pointPen)
+	parser.parse(data)
+
+def readGlyphInfoFromString(data, glyphObject):
+	"""
+	Read the data that precedes the outline element
+	into the glyph object. Parsing stops as soon as
+	the outline element is found, so anything after
+	it (including the glyph lib) will not be read.
+	"""
+	parser = _GlyphParser(glyphObject, None, stopAtOutline=True)
+	parser.parse(data)
+
+class _StopParsing(Exception): pass
+
+class _GlyphParser(object):
+
+	"""
+	The expat handlers are swapped as the parser
+	moves through the GLIF structure so that each
+	handler only needs to deal with the elements
+	that are allowed at its position:
+
+		glyph
+			glyph children
+				outline children
+					points
+
+	expat is set to return UTF-8 encoded strings
+	instead of unicode strings, as decoding every
+	name and attribute is a significant part of the
+	parse time. Text values are passed through decodeString
+	so that they are the same as the values returned
+	by ElementTree.
+	"""
+
+	def __init__(self, glyphObject, pointPen, stopAtOutline=False):
+		self.glyphObject = glyphObject
+		self.pointPen = pointPen
+		self.stopAtOutline = stopAtOutline
+		self.unicodes = []
+		self.guidelines = []
+		self.anchors = []
+		self.identifiers = set()
+		self.text = []
+		self.skipDepth = 0
+		self.libBuilder = None
+		self.libDepth = 0
+		self.inContour = False
+		self.addPoint = None
+		parser = self.parser = expat.ParserCreate()
+		parser.buffer_text = True
+		parser.returns_unicode = False
+		parser.StartElementHandler = self.startGlyph
+		parser.EndElementHandler = None
+
+	def parse(self, data):
+		try:
+			self.parser.Parse(data, True)
+		except _StopParsing:
+			pass
+		self.endOutline()
+		glyphObject = self.glyphObject
+		# set the collected unicodes
+		if self.unicodes:
+			_relaxedSetattr(glyphObject, "unicodes", self.unicodes)
+		# set the collected guidelines
+		if self.guidelines:
+			_relaxedSetattr(glyphObject, "guidelines", self.guidelines)
+		# set the collected anchors
+		if self.anchors:
+			_relaxedSetattr(glyphObject, "anchors", self.anchors)
+
+	def setHandlers(self, start, end, characters=None):
+		parser = self.parser
+		parser.StartElementHandler = start
+		parser.EndElementHandler = end
+		parser.CharacterDataHandler = characters
+
+	# glyph
+
+	def startGlyph(self, name, attrs):
+		glyphName = decodeString(attrs.get("name"))
+		if glyphName and self.glyphObject is not None:
+			_relaxedSetattr(self.glyphObject, "name", glyphName)
+		self.setHandlers(self.startGlyphChild, self.endGlyphChild)
+
+	def startGlyphChild(self, name, attrs):
+		glyphObject = self.glyphObject
+		if name == "outline":
+			if self.stopAtOutline:
+				raise _StopParsing
+			elif self.pointPen is not None:
+				self.startOutline()
+			else:
+				self.startSkip()
+		elif glyphObject is None:
+			self.startSkip()
+		elif name == "advance":
+			width = _number(attrs.get("width", 0))
+			_relaxedSetattr(glyphObject, "width", width)
+			height = _number(attrs.get("height", 0))
+			_relaxedSetattr(glyphObject, "height", height)
+		elif name == "unicode":
+			try:
+				v = attrs.get("hex", "undefined")
+				v = int(v, 16)
+				if v not in self.unicodes:
+					self.unicodes.append(v)
+			except ValueError:
+				raise GlyphTreeError("Illegal value for hex attribute of unicode element.")
+		elif name == "guideline":
+			attrs = _decodeAttributes(attrs)
+			for attr in ("x", "y", "angle"):
+				if attr in attrs:
+					attrs[attr] = _number(attrs[attr])
+			self.guidelines.append(attrs)
+		elif name == "anchor":
+			attrs = _decodeAttributes(attrs)
+			for attr in ("x", "y"):
+				if attr in attrs:
+					attrs[attr] = _number(attrs[attr])
+			self.anchors.append(attrs)
+		elif name == "image":
+			attrs = _decodeAttributes(attrs)
+			for attr, default in _transformationInfo:
+				value = default
+				if attr in attrs:
+					value = attrs[attr]
+				attrs[attr] = _number(value)
+			_relaxedSetattr(glyphObject, "image", attrs)
+		elif name == "note":
+			self.text = []
+			self.parser.CharacterDataHandler = self.text.append
+		elif name == "lib":
+			self.libBuilder = PlistBuilder(self.parser)
+			self.libDepth = 1
+			self.setHandlers(self.startLib, self.endLib)
+		else:
+			raise GlyphTreeError("Unknown element in GLIF: %s" % name)
+
+	def endGlyphChild(self, name):
+		if name == "note":
+			self.parser.CharacterDataHandler = None
+			lines = decodeString("".join(self.text)).split("\n")
+			lines = [line.strip() for line in lines]
+			note = "\n".join(lines)
+			_relaxedSetattr(self.glyphObject, "note", note)
+
+	# skipped elements
+
+	def startSkip(self):
+		self.skipDepth = 1
+		self.setHandlers(self.startSkipped, self.endSkipped)
+
+	def startSkipped(self, name, attrs):
+		self.skipDepth += 1
+
+	def endSkipped(self, name):
+		self.skipDepth -= 1
+		if not self.skipDepth:
+			self.setHandlers(self.startGlyphChild, self.endGlyphChild)
+
+	# lib
+
+	def startLib(self, name, attrs):
+		self.libDepth += 1
+		self.libBuilder.start(name, attrs)
+
+	def endLib(self, name):
+		self.libDepth -= 1
+		if self.libDepth:
+			self.libBuilder.end(name)
+		else:
+			lib = self.libBuilder.close()
+			self.libBuilder = None
+			self.setHandlers(self.startGlyphChild, self.endGlyphChild)
+			if lib is None:
+				lib = {}
+			_relaxedSetattr(self.glyphObject, "lib", lib)
+
+	# outline
+
+	"""
+	No end handler is used within the outline, as
+	calling a handler for the end of every point is
+	a significant part of the parse time. Instead,
+	the end of a contour is detected by the start of
+	the next outline element and the end of the outline
+	is detected by the start of the next glyph element
+	or by the end of the data.
+	"""
+
+	def startOutline(self):
+		self.inContour = False
+		self.setHandlers(self.startOutlineChild, None)
+
+	def endOutline(self):
+		if self.inContour:
+			self.pointPen.endPath()
+			self.inContour = False
+
+	def startOutlineChild(self, name, attrs):
+		if self.inContour:
+			self.pointPen.endPath()
+			self.inContour = False
+		if name == "contour":
+			identifier = decodeString(attrs.get("identifier"))
+			if identifier is not None:
+				self.identifiers.add(identifier)
+			self.pointPen.beginPath(identifier=identifier)
+			self.addPoint = self.pointPen.addPoint
+			self.inContour = True
+			self.parser.StartElementHandler = self.startPoint
+		elif name == "component":
+			baseGlyphName = decodeString(attrs.get("base"))
+			transformation = []
+			for attr, default in _transformationInfo:
+				value = attrs.get(attr)
+				if value is None:
+					value = default
+				else:
+					value = _number(value)
+				transformation.append(value)
+			identifier = decodeString(attrs.get("identifier"))
+			self.pointPen.addComponent(baseGlyphName, tuple(transformation), identifier=identifier)
+			self.parser.EndElementHandler = self.endComponent
+		elif name in _glyphChildren:
+			self.endOutline()
+			self.setHandlers(self.startGlyphChild, self.endGlyphChild)
+			self.startGlyphChild(name, attrs)
+		else:
+			raise GlyphTreeError("Unknown element in outline element: %s" % name)
+
+	def endComponent(self, name):
+		if name != "component":
+			raise GlyphTreeError("Unknown child elements of component element.")
+		self.parser.EndElementHandler = None
+
+	def startPoint(self, name, attrs):
+		if name != "point":
+			self.parser.StartElementHandler = self.startOutlineChild
+			self.startOutlineChild(name, attrs)
+			return
+		x = _number(attrs["x"])
+		y = _number(attrs["y"])
+		smooth = attrs.get("smooth") == "yes"
+		name = attrs.get("name")
+		if name is not None:
+			name = decodeString(name)
+		identifier = attrs.get("identifier")
+		if identifier is not None:
+			identifier = decodeString(identifier)
+		self.addPoint((x, y), segmentType=attrs.get("type"), smooth=smooth, name=name, identifier=identifier)
+
+_glyphChildren = set(["advance", "unicode", "guideline", "anchor", "image", "note", "lib", "outline"])
+
+# -------------
+# Glyph Writing
+# -------------
+
+_prettyIndents = ["\n" + "\t" * level for level in range(4)]
+_compactIndents = [""] * 4
+
+def writeGlyphToString(glyph, compact=False):
+	"""
+	Write a glyph to a GLIF string. If compact is True,
+	the data will not be indented.
+	"""
+	parts = []
+	writeGlyphToStream(glyph, parts.append, compact=compact)
+	return "".join(parts)
+
+def writeGlyphToStream(glyph, write, compact=False):
+	"""
+	Write a glyph by passing the GLIF data, in pieces,
+	to the given write function. This may be the write
+	method of a file object or the append method of a list.
+	If compact is True, the data will not be indented.
+	"""
+	if compact:
+		indents = _compactIndents
+	else:
+		indents = _prettyIndents
+	write("<glyph format=\"2\" name=\"%s\">" % escapeAttribute(glyph.name))
+	_writeAdvance(glyph, write, indents)
+	_writeUnicodes(glyph, write, indents)
+	_writeNote(glyph, write, indents)
+	_writeImage(glyph, write, indents)
+	_writeGuidelines(glyph, write, indents)
+	_writeAnchors(glyph, write, indents)
+	_writeOutline(glyph, write, indents)
+	_writeLib(glyph, write, indents, compact)
+	write(indents[0] + "</glyph>" + indents[0])
+
+def _writeAdvance(glyph, write, indents):
+	width = glyph.width
+	height = glyph.height
+	if width or height:
+		attrib = {}
+		if width:
+			attrib["width"] = str(width)
+		if height:
+			attrib["height"] = str(height)
+		write(indents[1] + _emptyElement("advance", attrib))
+
+def _writeUnicodes(glyph, write, indents):
+	for code in glyph.unicodes:
+		hexCode = hex(code)[2:].upper()
+		if len(hexCode) < 4:
+			hexCode = "0" * (4 - len(hexCode)) + hexCode
+		write(indents[1] + "<unicode hex=\"%s\" />" % hexCode)
+
+def _writeNote(glyph, write, indents):
+	note = glyph.note
+	if note:
+		write(indents[1] + "<note>%s</note>" % escapeText(note))
+
+def _writeImage(glyph, write, indents):
+	if not glyph.image:
+		return
+	write(indents[1] + _emptyElement("image", _stringAttributes(glyph.image)))
+
+def _writeGuidelines(glyph, write, indents):
+	for guideline in glyph.guidelines:
+		write(indents[1] + _emptyElement("guideline", _stringAttributes(guideline)))
+
+def _writeAnchors(glyph, write, indents):
+	for anchor in glyph.anchors:
+		write(indents[1] + _emptyElement("anchor", _stringAttributes(anchor)))
+
+def _writeLib(glyph, write, indents, compact):
+	if glyph.lib:
+		write(indents[1] + "<lib>")
+		writeObjectToStream(glyph.lib, write, level=2, compact=compact)
+		write(indents[1] + "</lib>")
+
+def _writeOutline(glyph, write, indents):
+	if not glyph.contours and not glyph.components:
+		write(indents[1] + "<outline />")
+		return
+	write(indents[1] + "<outline>")
+	_writeContours(glyph, write, indents)
+	_writeComponents(glyph, write, indents)
+	write(indents[1] + "</outline>")
+
+def _writeContours(glyph, write, indents):
+	for contour in glyph.contours:
+		attrib = {}
+		if contour.identifier:
+			attrib["identifier"] = contour.identifier
+		if not len(contour):
+			write(indents[2] + _emptyElement("contour", attrib))
+			continue
+		write(indents[2] + _startTag("contour", attrib) + ">")
+		xs, ys, segmentTypes, smooths, names, identifiers = _getPointData(contour)
+		formats = _getPointFormats(indents[3])
+		points = []
+		append = points.append
+		if names is None and identifiers is None:
+			for x, y, segmentType, smooth in izip(xs, ys, segmentTypes, smooths):
+				key = (segmentType, smooth)
+				if key not in formats:
+					_addPointFormat(formats, indents[3], key)
+				append(formats[key] % ("", x, y))
+		else:
+			for index, (x, y, segmentType, smooth) in enumerate(izip(xs, ys, segmentTypes, smooths)):
+				key = (segmentType, smooth)
+				if key not in formats:
+					_addPointFormat(formats, indents[3], key)
+				# the attributes are written in sorted order
+				text = ""
+				if identifiers is not None and identifiers.get(index):
+					text += " identifier=\"%s\"" % escapeAttribute(identifiers[index])
+				if names is not None and names.get(index):
+					text += " name=\"%s\"" % escapeAttribute(names[index])
+				append(formats[key] % (text, x, y))
+		write("".join(points))
+		write(indents[2] + "</contour>")
+
+# The point element text for each indent, segment type and
+# smooth flag is formatted once and stored in a dict of form:
+# {
+#     indent : {
+#         (segment type, smooth) : format
+#     }
+# }
+# The format takes the identifier and name attributes, x and y.
+
+_pointFormats = {}
+
+def _getPointFormats(indent):
+	formats = _pointFormats.get(indent)
+	if formats is None:
+		formats = _pointFormats[indent] = {}
+	return formats
+
+def _addPointFormat(formats, indent, key):
+	segmentType, smooth = key
+	text = indent.replace("%", "%%") + "<point%s"
+	if smooth:
+		text += " smooth=\"yes\""
+	if segmentType:
+		text += (" type=\"%s\"" % escapeAttribute(segmentType)).replace("%", "%%")
+	text += " x=\"%s\" y=\"%s\" />"
+	formats[key] = text
+
+def _writeComponents(glyph, write, indents):
+	for component in glyph.components:
+		base, transformation, identifier = component
+		attrib = dict(base=base)
+		if transformation:
+			for i, (attr, default) in enumerate(_transformationInfo):
+				value = transformation[i]
+				if value != default:
+					attrib[attr] = str(value)
+		if identifier:
+			attrib["identifier"] = identifier
+		write(indents[2] + _emptyElement("component", attrib))
+
+# ---------------------
+# Misc Helper Functions
+# ---------------------
+
+def _startTag(tag, attrib):
+	parts = ["<" + tag]
+	for attr, value in sorted(attrib.items()):
+		parts.append(" %s=\"%s\"" % (attr, escapeAttribute(value)))
+	return "".join(parts)
+
+def _emptyElement(tag, attrib):
+	return _startTag(tag, attrib) + " />"
+
+def _decodeAttributes(attrs):
+	return {decodeString(attr) : decodeString(value) for attr, value in attrs.items()}
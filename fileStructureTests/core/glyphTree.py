@@ -1,3 +1,4 @@
+from itertools import izip
 from environment import ET
 from plistTree import convertTreeToPlist, convertPlistToTree
 
@@ -93,9 +94,8 @@ def _readNote(glyphObject, element):
 	_relaxedSetattr(glyphObject, "note", note)
 
 def _readLib(glyphObject, element):
-	from plist import convertTreeToPlist
 	assert len(element) == 1
-	lib = convertTreeToPlist(element[0])
+	lib = convertTreeToPlist(element)
 	if lib is None:
 		lib = {}
 	_relaxedSetattr(glyphObject, "lib", lib)
@@ -213,26 +213,25 @@ def _writeImage(glyph, tree):
 	if not glyph.image:
 		return
 	element = ET.Element("image")
-	element.attrib.update(glyph.image)
-	tree.append(image)
+	element.attrib.update(_stringAttributes(glyph.image))
+	tree.append(element)
 
 def _writeGuidelines(glyph, tree):
 	for guideline in glyph.guidelines:
-		data = {}
-		for key, value in guideline.items():
-			data[key] = str(value)
 		element = ET.Element("guideline")
-		tree.append(guideline)
+		element.attrib.update(_stringAttributes(guideline))
+		tree.append(element)
 
 def _writeAnchors(glyph, tree):
 	for anchor in glyph.anchors:
 		element = ET.Element("anchor")
-		element.attrib.update(anchor)
+		element.attrib.update(_stringAttributes(anchor))
 		tree.append(element)
 
 def _writeLib(glyph, tree):
 	if glyph.lib:
-		element = convertPlistToTree(glyph.lib)
+		element = ET.Element("lib")
+		element.append(convertPlistToTree(glyph.lib)[0])
 		tree.append(element)
 
 def _writeOutline(glyph, tree):
@@ -246,20 +245,52 @@ def _writeContours(glyph, tree):
 		contourElement = ET.Element("contour")
 		if contour.identifier:
 			contourElement.attrib["identifier"] = contour.identifier
-		for point in contour:
-			(x, y), segmentType, smooth, name, identifier = point
-			pointElement = ET.Element("point")
-			pointElement.attrib["x"] = str(x)
-			pointElement.attrib["y"] = str(y)
+		xs, ys, segmentTypes, smooths, names, identifiers = _getPointData(contour)
+		for index, (x, y, segmentType, smooth) in enumerate(izip(xs, ys, segmentTypes, smooths)):
+			attrib = {"x" : str(x), "y" : str(y)}
 			if segmentType:
-				pointElement.attrib["type"] = segmentType
+				attrib["type"] = segmentType
 			if smooth:
-				pointElement.attrib["smooth"] = "yes"
-			if identifier:
-				pointElement.attrib["identifier"] = identifier
-			contourElement.append(pointElement)
+				attrib["smooth"] = "yes"
+			if names is not None and names.get(index):
+				attrib["name"] = names[index]
+			if identifiers is not None and identifiers.get(index):
+				attrib["identifier"] = identifiers[index]
+			contourElement.append(ET.Element("point", attrib))
 		tree.append(contourElement)
 
+def _getPointData(contour):
+	"""
+	Get the point data of a contour as a tuple of
+	parallel sequences:
+
+		(x values, y values, segment types, smooth flags, names, identifiers)
+
+	names and identifiers are dicts of point index : value
+	or None. Contours that have a getPointData method with
+	the same result, such as objects.Contour, give the data
+	directly. Other contours are iterated.
+	"""
+	getPointData = getattr(contour, "getPointData", None)
+	if getPointData is not None:
+		return getPointData()
+	xs = []
+	ys = []
+	segmentTypes = []
+	smooths = []
+	names = {}
+	identifiers = {}
+	for index, ((x, y), segmentType, smooth, name, identifier) in enumerate(contour):
+		xs.append(x)
+		ys.append(y)
+		segmentTypes.append(segmentType)
+		smooths.append(bool(smooth))
+		if name:
+			names[index] = name
+		if identifier:
+			identifiers[index] = identifier
+	return xs, ys, segmentTypes, smooths, names or None, identifiers or None
+
 _transformationInfo = [
 	# field name, default value
 	("xScale",    1),
@@ -279,15 +310,26 @@ def _writeComponents(glyph, tree):
 			for i, (attr, default) in enumerate(_transformationInfo):
 				value = transformation[i]
 				if value != default:
-					element.attrib[attr] = value
+					element.attrib[attr] = str(value)
 		if identifier:
-			element.attrib["identifier"]
+			element.attrib["identifier"] = identifier
 		tree.append(element)
 
 # ---------------------
 # Misc Helper Functions
 # ---------------------
 
+def _stringAttributes(attrib):
+	"""
+	Convert the values in an attribute dict to strings.
+	"""
+	converted = {}
+	for attr, value in attrib.items():
+		if not isinstance(value, basestring):
+			value = str(value)
+		converted[attr] = value
+	return converted
+
 def _relaxedSetattr(object, attr, value):
 	try:
 		setattr(object, attr, value)
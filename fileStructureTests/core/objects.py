@@ -1,47 +1,324 @@
+import sys
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from itertools import izip, repeat
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class DecompositionError(Exception): pass
+
+
 class Font(object):
 
+	"""
+	The font tracks which of its parts have changed since
+	they were loaded or saved, so that save only writes
+	those parts. Assigning to info, groups, kerning, lib
+	or features marks the part as changed, as do changes
+	made to the groups, kerning and lib dicts. Changes
+	made in place to the values of those dicts (for
+	example, appending to a group) are not detected.
+	"""
+
 	def __init__(self):
+		self._featuresDirty = False
 		self.info = FontInfo()
 		self.groups = {}
 		self.kerning = {}
 		self.lib = {}
 		self.features = None
 		self.layers = {}
+		self._markClean()
+
+	def _markClean(self):
+		"""
+		Mark the info, groups, kerning, lib and
+		features as unchanged.
+		"""
+		self.info.dirty = False
+		for attr in _trackedDictAttributes:
+			getattr(self, attr).dirty = False
+		self._featuresDirty = False
+
+	def __setattr__(self, attr, value):
+		if attr in _trackedDictAttributes:
+			if value is None:
+				value = {}
+			if isinstance(value, TrackingDict):
+				value.dirty = True
+			else:
+				value = TrackingDict(value)
+		super(Font, self).__setattr__(attr, value)
+		if attr == "features":
+			self._featuresDirty = True
 
 	def newLayer(self, layerName):
 		layer = Layer(None, layerName)
 		self.layers[layerName] = layer
 		return layer
 
-	def loadLayers(self, reader):
-		for layerName in reader.getLayerNames():
-			self.layers[layerName] = Layer(reader, layerName)
+	def load(self, reader, loadGlyphs=False, cacheSize=None, cacheMemory=None, processes=None):
+		"""
+		Read the font info, groups, kerning, lib, features
+		and layers with the given reader. Everything that
+		is read is marked as unchanged. cacheSize and
+		cacheMemory are passed to the layers. See loadLayers
+		for processes.
+		"""
+		reader.readMetaInfo()
+		self.info = FontInfo()
+		reader.readInfo(self.info)
+		for attr in _trackedDictAttributes:
+			setattr(self, attr, getattr(reader, "read" + attr.title())())
+		self.features = reader.readFeatures()
+		self._markClean()
+		self.loadLayers(reader, loadGlyphs=loadGlyphs, cacheSize=cacheSize, cacheMemory=cacheMemory, processes=processes)
+
+	def loadLayers(self, reader, loadGlyphs=False, cacheSize=None, cacheMemory=None, processes=None):
+		"""
+		Create the layers with the given reader. If loadGlyphs
+		is True, all glyphs are loaded. If processes is also
+		given, the glyphs are parsed by a pool of that many
+		worker processes. See UFOReaderWriter.readGlyphsParallel.
+		"""
+		pool = None
+		if loadGlyphs and processes:
+			pool = multiprocessing.Pool(processes)
+		try:
+			for layerName in reader.getLayerNames():
+				layer = Layer(reader, layerName, cacheSize=cacheSize, cacheMemory=cacheMemory)
+				if loadGlyphs:
+					layer.loadGlyphs(pool=pool)
+				self.layers[layerName] = layer
+		finally:
+			if pool is not None:
+				pool.close()
+				pool.join()
+
+	def save(self, writer):
+		"""
+		Write the parts of the font that have changed since
+		they were loaded or saved with the given writer. The
+		glyph set contents and the layer contents are only
+		rewritten by the file system if a glyph or a layer
+		was added. The writer must be closed to complete
+		the write, as with the other writing methods.
+		"""
+		writer.writeMetaInfo()
+		if self.info.dirty:
+			writer.writeInfo(self.info)
+			self.info.dirty = False
+		for attr in _trackedDictAttributes:
+			value = getattr(self, attr)
+			if value.dirty:
+				getattr(writer, "write" + attr.title())(value)
+				value.dirty = False
+		if self._featuresDirty:
+			writer.writeFeatures(self.features)
+			self._featuresDirty = False
+		for layerName, layer in self.layers.items():
+			glyphs = layer.getDirtyGlyphs()
+			if not glyphs:
+				continue
+			writer.writeGlyphs(layerName, glyphs)
+			layer.markClean()
+			writer.writeGlyphSetContents(layerName)
+		writer.writeLayerContents()
+
+
+_trackedDictAttributes = ["groups", "kerning", "lib"]
+
+
+class TrackingDict(dict):
+
+	"""
+	A dict that sets its dirty attribute to True when
+	items are added, changed or removed.
+	"""
 
+	def __init__(self, *args, **kwargs):
+		super(TrackingDict, self).__init__(*args, **kwargs)
+		self.dirty = True
 
-class FontInfo(object): pass
+	def __setitem__(self, key, value):
+		super(TrackingDict, self).__setitem__(key, value)
+		self.dirty = True
+
+	def __delitem__(self, key):
+		super(TrackingDict, self).__delitem__(key)
+		self.dirty = True
+
+	def clear(self):
+		super(TrackingDict, self).clear()
+		self.dirty = True
+
+	def pop(self, *args):
+		self.dirty = True
+		return super(TrackingDict, self).pop(*args)
+
+	def popitem(self):
+		self.dirty = True
+		return super(TrackingDict, self).popitem()
+
+	def setdefault(self, key, default=None):
+		if key not in self:
+			self.dirty = True
+		return super(TrackingDict, self).setdefault(key, default)
+
+	def update(self, *args, **kwargs):
+		super(TrackingDict, self).update(*args, **kwargs)
+		self.dirty = True
+
+
+class FontInfo(object):
+
+	"""
+	Setting any attribute sets dirty to True.
+	"""
+
+	def __init__(self):
+		self.dirty = False
+
+	def __setattr__(self, attr, value):
+		super(FontInfo, self).__setattr__(attr, value)
+		if attr != "dirty":
+			super(FontInfo, self).__setattr__("dirty", True)
 
 
 class Layer(object):
 
-	def __init__(self, reader, name):
+	"""
+	Glyphs are loaded from the reader when they are first
+	requested. By default, loaded glyphs are kept until the
+	layer is released. If cacheSize (a number of glyphs) or
+	cacheMemory (an estimated number of bytes) is given, the
+	least recently used glyphs are released when the budget
+	is exceeded and they are read again when they are next
+	requested. Dirty glyphs are never released. A released
+	glyph is no longer part of the layer, so references to
+	glyphs should not be kept while iterating over a layer
+	with a cache.
+	"""
+
+	def __init__(self, reader, name, cacheSize=None, cacheMemory=None):
 		self.reader = reader
 		self.name = name
+		self.cacheSize = cacheSize
+		self.cacheMemory = cacheMemory
+		self._cache = OrderedDict()
+		self._cachedMemory = 0
+		self._dirtyGlyphNames = set()
+		self._componentReferences = None
+		self._componentBases = None
+		self._changedComponentGlyphNames = set()
 		if reader is None:
 			self._glyphs = {}
 		else:
 			self._glyphs = dict.fromkeys(reader.getGlyphNames(name))
 
+	def _attachGlyph(self, glyphName, glyph):
+		glyph._layer = self
+		glyph._layerGlyphName = glyphName
+		if glyph.dirty:
+			self._dirtyGlyphNames.add(glyphName)
+		self._glyphs[glyphName] = glyph
+
 	def newGlyph(self, glyphName):
 		glyph = Glyph()
 		glyph.name = glyphName
-		self._glyphs[glyphName] = glyph
+		self._attachGlyph(glyphName, glyph)
+		# the glyph may replace a glyph with components
+		self._changedComponentGlyphNames.add(glyphName)
 		return glyph
 
 	def loadGlyph(self, glyphName):
 		glyph = Glyph()
 		self.reader.readGlyph(self.name, glyphName, glyph)
+		glyph.dirty = False
 		return glyph
 
+	def loadGlyphs(self, glyphNames=None, pool=None):
+		"""
+		Load the glyphs with the given names or all glyphs
+		that are not loaded if glyphNames is None. If a
+		multiprocessing pool is given, the glyphs are parsed
+		by its worker processes.
+		"""
+		if glyphNames is None:
+			glyphNames = [glyphName for glyphName, glyph in self._glyphs.items() if glyph is None]
+		if pool is None:
+			glyphs = self.reader.readGlyphs(self.name, glyphNames, Glyph)
+		else:
+			glyphs = self.reader.readGlyphsParallel(self.name, glyphNames, Glyph, pool)
+		for glyphName, glyph in glyphs:
+			glyph.dirty = False
+			self._attachGlyph(glyphName, glyph)
+			self._cacheGlyph(glyphName, glyph)
+
+	# cache
+
+	def _cacheGlyph(self, glyphName, glyph):
+		"""
+		Add a glyph to the cache as the most recently used
+		glyph and release the least recently used glyphs until
+		the cache is within its budget. Dirty glyphs are taken
+		out of the cache instead of being released. They are
+		added again when they are marked clean.
+		"""
+		if self.cacheSize is None and self.cacheMemory is None:
+			return
+		cache = self._cache
+		size = cache.pop(glyphName, None)
+		if size is None:
+			size = _estimateGlyphMemory(glyph)
+			self._cachedMemory += size
+		cache[glyphName] = size
+		# the requested glyph is always kept
+		while len(cache) > 1 and self._cacheIsOverBudget():
+			glyphName, size = cache.popitem(last=False)
+			self._cachedMemory -= size
+			glyph = self._glyphs[glyphName]
+			if not glyph.dirty:
+				glyph._layer = None
+				self._glyphs[glyphName] = None
+
+	def _cacheIsOverBudget(self):
+		if self.cacheSize is not None and len(self._cache) > self.cacheSize:
+			return True
+		if self.cacheMemory is not None and self._cachedMemory > self.cacheMemory:
+			return True
+		return False
+
+	def getDirtyGlyphs(self):
+		"""
+		Get a sorted list of (glyph name, glyph) tuples for
+		the glyphs that have changed since they were loaded
+		or marked clean. This only visits the changed glyphs.
+		"""
+		glyphs = []
+		for glyphName in sorted(self._dirtyGlyphNames):
+			glyph = self._glyphs.get(glyphName)
+			if glyph is not None and glyph.dirty:
+				glyphs.append((glyphName, glyph))
+		return glyphs
+
+	def markClean(self):
+		"""
+		Mark all glyphs as unchanged.
+		"""
+		dirtyGlyphNames = list(self._dirtyGlyphNames)
+		self._dirtyGlyphNames.clear()
+		for glyphName in dirtyGlyphNames:
+			glyph = self._glyphs.get(glyphName)
+			if glyph is not None:
+				glyph.dirty = False
+				# clean glyphs may now be released
+				self._cacheGlyph(glyphName, glyph)
+
 	def keys(self):
 		return self._glyphs.keys()
 
@@ -49,34 +326,264 @@ class Layer(object):
 		return name in self._glyphs
 
 	def __iter__(self):
-		names = self.keys()
-		while names:
-			name = names[0]
+		for name in self.keys():
 			yield self[name]
-			names = names[1:]
 
 	def __getitem__(self, name):
-		if self._glyphs[name] is None:
-			self._glyphs[name] = self.loadGlyph(name)
-		return self._glyphs[name]
+		glyph = self._glyphs[name]
+		if glyph is None:
+			glyph = self.loadGlyph(name)
+			self._attachGlyph(name, glyph)
+			self._cacheGlyph(name, glyph)
+		elif name in self._cache:
+			self._cacheGlyph(name, glyph)
+		return glyph
 
 	def get(self, name):
 		return self._glyphs.get(name)
 
+	# geometry
+
+	def getBounds(self, glyphNames=None):
+		"""
+		Get a dict of glyph name : bounds for the given glyph
+		names or for all glyphs if glyphNames is None. See
+		Glyph.getBounds for the bounds values.
+		"""
+		if glyphNames is None:
+			glyphNames = self.keys()
+		return {glyphName : self[glyphName].getBounds() for glyphName in glyphNames}
+
+	def getPointCounts(self, glyphNames=None):
+		"""
+		Get a dict of glyph name : number of contour points
+		for the given glyph names or for all glyphs if
+		glyphNames is None.
+		"""
+		if glyphNames is None:
+			glyphNames = self.keys()
+		return {glyphName : self[glyphName].getPointCount() for glyphName in glyphNames}
+
+	# component references
+
+	def getComponentReferences(self, glyphName):
+		"""
+		Get a set of the names of the glyphs that directly
+		use the glyph with the given name as a component.
+		"""
+		references = self._getComponentReferences()
+		return set(references.get(glyphName, ()))
+
+	def getDependentGlyphNames(self, glyphName):
+		"""
+		Get a set of the names of the glyphs that use the
+		glyph with the given name as a component, directly
+		or through nested components. These are the glyphs
+		that are affected by a change to the glyph.
+		"""
+		references = self._getComponentReferences()
+		return _collectDependentGlyphNames(references, glyphName)
+
+	def _getComponentReferences(self):
+		"""
+		Get the reverse component graph of form:
+
+			{
+				base glyph name : set([composite glyph names])
+			}
+
+		The graph is built from the reader, which does not need
+		to read the glyphs if the glyph set metadata is current,
+		and from the glyphs that were created in the layer. The
+		glyphs notify the layer when their components change.
+		The graph is updated for those glyphs when it is next
+		requested.
+		"""
+		if self._componentReferences is None:
+			references = {}
+			bases = {}
+			if self.reader is not None:
+				references = self.reader.getComponentReferences(self.name)
+				for baseGlyphName, glyphNames in references.items():
+					for glyphName in glyphNames:
+						if glyphName not in bases:
+							bases[glyphName] = set()
+						bases[glyphName].add(baseGlyphName)
+			else:
+				self._changedComponentGlyphNames.update(self._glyphs.keys())
+			self._componentReferences = references
+			self._componentBases = bases
+		references = self._componentReferences
+		bases = self._componentBases
+		changed = self._changedComponentGlyphNames
+		while changed:
+			glyphName = changed.pop()
+			if glyphName not in self._glyphs:
+				continue
+			glyph = self[glyphName]
+			_removeComponentReferences(references, glyphName, bases.pop(glyphName, ()))
+			glyphBases = set([baseGlyphName for baseGlyphName, transformation, identifier in glyph.components])
+			_addComponentReferences(references, glyphName, glyphBases)
+			if glyphBases:
+				bases[glyphName] = glyphBases
+		return references
+
+	# decomposition
+
+	def getDecomposedContours(self, glyphName):
+		"""
+		Get a list of the contours of the glyph with the given
+		name with its components, including nested components,
+		replaced by the transformed contours of their base
+		glyphs. Components that reference glyphs that are not
+		in the layer are ignored until the glyphs are added to
+		the layer. DecompositionError is raised
+		if the components reference each other in a cycle.
+
+		The decomposed contours of each glyph and the contours
+		of each base glyph for each transformation are cached
+		in the outline cache of the glyph. The cached values
+		are reused until the outline of the glyph or of one
+		of its base glyphs changes. The returned contours are
+		shared by the cache, so they must not be modified.
+		"""
+		glyph, cache, entry = self._getDecomposition(glyphName, [], set())
+		return list(entry["contours"])
+
+	def _getDecomposition(self, glyphName, stack, valid):
+		"""
+		Get (glyph, outline cache, decomposition cache entry)
+		for a glyph. The entry is a dict of form:
+
+			{
+				contours : [contour],
+				bases : [(base glyph name, base glyph, base glyph outline cache, base glyph entry)],
+				missing : [names of base glyphs that are not in the layer],
+				transformed : {transformation : [contour]}
+			}
+
+		stack is the list of glyph names being decomposed and
+		valid is the set of glyph names with entries that are
+		known to be valid during this decomposition.
+		"""
+		if glyphName in stack:
+			raise DecompositionError("Component cycle: %s" % " -> ".join(stack[stack.index(glyphName):] + [glyphName]))
+		glyph = self[glyphName]
+		cache = glyph._getOutlineCache()
+		entry = cache.get("decomposition")
+		if entry is not None and glyphName not in valid:
+			for baseGlyphName in entry["missing"]:
+				# the base glyph has been added
+				if baseGlyphName in self._glyphs:
+					entry = None
+					break
+		if entry is not None and glyphName not in valid:
+			stack.append(glyphName)
+			for baseGlyphName, baseGlyph, baseCache, baseEntry in entry["bases"]:
+				if self._glyphs.get(baseGlyphName) is not baseGlyph or baseGlyph._outlineCache is not baseCache:
+					entry = None
+					break
+				if self._getDecomposition(baseGlyphName, stack, valid)[2] is not baseEntry:
+					entry = None
+					break
+			stack.pop()
+		if entry is None:
+			contours = list(glyph.contours)
+			bases = []
+			missing = []
+			stack.append(glyphName)
+			for baseGlyphName, transformation, identifier in glyph.components:
+				if baseGlyphName not in self:
+					missing.append(baseGlyphName)
+					continue
+				base = self._getDecomposition(baseGlyphName, stack, valid)
+				bases.append((baseGlyphName,) + base)
+				contours.extend(_transformDecomposition(base[2], transformation))
+			stack.pop()
+			entry = dict(contours=contours, bases=bases, missing=missing, transformed={})
+			cache["decomposition"] = entry
+		valid.add(glyphName)
+		return glyph, cache, entry
+
 
 class Glyph(object):
 
+	"""
+	Setting any public attribute and drawing into the
+	glyph with the point pen API sets dirty to True. If
+	the glyph belongs to a layer, the layer is notified.
+	Changes made in place to the lists and dicts of the
+	glyph are not detected, so dirty must be set to True
+	after making them.
+
+	The geometry values (bounds and point count) are cached
+	until the outline changes. The outline changes when
+	contours or components is set and when a contour or a
+	component is drawn into the glyph. As with dirty, changes
+	made in place are not detected. clearOutlineCache must
+	be called after making them.
+	"""
+
+	__slots__ = (
+		"_layer",
+		"_layerGlyphName",
+		"_outlineCache",
+		"dirty",
+		"name",
+		"width",
+		"height",
+		"unicodes",
+		"contours",
+		"components",
+		"guidelines",
+		"anchors",
+		"lib",
+		"image",
+		"note"
+	)
+
 	def __init__(self):
-		self.width = 0
-		self.height = 0
-		self.unicodes = []
-		self.contours = []
-		self.components = []
-		self.guidelines = []
-		self.anchors = []
-		self.lib = {}
-		self.image = None
-		self.note = ""
+		setattr = _setattr
+		setattr(self, "_layer", None)
+		setattr(self, "_layerGlyphName", None)
+		setattr(self, "_outlineCache", None)
+		setattr(self, "dirty", True)
+		setattr(self, "name", None)
+		setattr(self, "width", 0)
+		setattr(self, "height", 0)
+		setattr(self, "unicodes", [])
+		setattr(self, "contours", [])
+		setattr(self, "components", [])
+		setattr(self, "guidelines", [])
+		setattr(self, "anchors", [])
+		setattr(self, "lib", {})
+		setattr(self, "image", None)
+		setattr(self, "note", "")
+
+	def __getstate__(self):
+		# the layer and the caches are not pickled
+		return tuple([getattr(self, attr) for attr in _glyphStateAttributes])
+
+	def __setstate__(self, state):
+		_setattr(self, "_layer", None)
+		_setattr(self, "_layerGlyphName", None)
+		_setattr(self, "_outlineCache", None)
+		for attr, value in zip(_glyphStateAttributes, state):
+			_setattr(self, attr, value)
+
+	def __setattr__(self, attr, value):
+		_setattr(self, attr, value)
+		if attr == "dirty":
+			if value and self._layer is not None:
+				self._layer._dirtyGlyphNames.add(self._layerGlyphName)
+		else:
+			if attr in _outlineAttributes:
+				_setattr(self, "_outlineCache", None)
+				if attr == "components" and self._layer is not None:
+					self._layer._changedComponentGlyphNames.add(self._layerGlyphName)
+			# the layer only needs to be notified once
+			if not self.dirty and attr[0] != "_":
+				self.dirty = True
 
 	def drawPoints(self, pointPen):
 		raise NotImplementedError
@@ -89,18 +596,406 @@ class Glyph(object):
 		contour = Contour()
 		contour.identifier = identifier
 		self.contours.append(contour)
+		_setattr(self, "_outlineCache", None)
+		if not self.dirty:
+			self.dirty = True
 
 	def endPath(self):
-		pass
+		# the points are not tracked individually
+		_setattr(self, "_outlineCache", None)
 
 	def addPoint(self, pt, segmentType=None, smooth=False, name=None, identifier=None, **kwargs):
-		self.contours[-1].append((pt, segmentType, smooth, name, identifier))
+		# the contour was marked when it was started
+		self.contours[-1].addPoint(pt, segmentType, smooth, name, identifier)
 
 	def addComponent(self, baseGlyphName, transformation, identifier=None, **kwargs):
 		component = (baseGlyphName, transformation, identifier)
 		self.components.append(component)
+		_setattr(self, "_outlineCache", None)
+		if self._layer is not None:
+			self._layer._changedComponentGlyphNames.add(self._layerGlyphName)
+		if not self.dirty:
+			self.dirty = True
+
+	# --------
+	# Geometry
+	# --------
+
+	def clearOutlineCache(self):
+		_setattr(self, "_outlineCache", None)
+
+	def _getOutlineCache(self):
+		cache = self._outlineCache
+		if cache is None:
+			cache = {}
+			_setattr(self, "_outlineCache", cache)
+		return cache
+
+	def getBounds(self):
+		"""
+		Get the control box of the contours as (xMin, yMin,
+		xMax, yMax) or None if the contours have no points.
+		Components are not included.
+		"""
+		cache = self._getOutlineCache()
+		if "bounds" not in cache:
+			cache["bounds"] = _unionBounds([contour.getBounds() for contour in self.contours])
+		return cache["bounds"]
+
+	def getPointCount(self):
+		"""
+		Get the number of points in the contours.
+		"""
+		cache = self._getOutlineCache()
+		if "pointCount" not in cache:
+			cache["pointCount"] = sum([len(contour) for contour in self.contours])
+		return cache["pointCount"]
+
+	def getTransformedContours(self, transformation):
+		"""
+		Get a list of new contours with the contours of the
+		glyph transformed by the given component transformation
+		(xScale, xyScale, yxScale, yScale, xOffset, yOffset).
+		"""
+		return [contour.transform(transformation) for contour in self.contours]
+
+
+_setattr = object.__setattr__
+
+_glyphStateAttributes = [attr for attr in Glyph.__slots__ if not attr.startswith("_")]
+
+_outlineAttributes = set(["contours", "components"])
+
+
+class Contour(object):
+
+	"""
+	The points are stored in arrays instead of as individual
+	objects. The coordinates are stored as x, y pairs in an
+	array of integers, which is converted to an array of
+	doubles when a float coordinate is added. From then on
+	an array of bytes records which coordinates were added
+	as integers, so that they are given back as integers
+	and the floats are given back as floats. The segment
+	types and smooth flags are stored in an array of bytes.
+	Point names and point identifiers are rare, so they are
+	stored in dicts of point index : value that are only
+	created when needed.
+
+	Iterating over the contour gives the points as tuples
+	of form:
+
+		((x, y), segment type, smooth, name, identifier)
+
+	getPointData gives the same data as parallel sequences,
+	which is much faster when all points are needed.
+
+	>>> from glyphString import readGlyphFromString, writeGlyphToString
+	>>> data = '<glyph format="2" name="a"><outline><contour><point type="line" x="100.0" y="200" /><point type="line" x="1.5" y="2" /></contour></outline></glyph>'
+	>>> glyph = Glyph()
+	>>> readGlyphFromString(data, glyph, glyph)
+	>>> writeGlyphToString(glyph, compact=True) == data
+	True
+	>>> list(glyph.contours[0])
+	[((100.0, 200), 'line', False, None, None), ((1.5, 2), 'line', False, None, None)]
+	"""
+
+	__slots__ = ("identifier", "_coordinates", "_integers", "_flags", "_names", "_identifiers")
+
+	def __init__(self):
+		self.identifier = None
+		self._coordinates = array("l")
+		self._integers = None
+		self._flags = array("B")
+		self._names = None
+		self._identifiers = None
+
+	def addPoint(self, pt, segmentType=None, smooth=False, name=None, identifier=None):
+		flags = _segmentTypeFlags.get(segmentType)
+		if flags is None:
+			raise ValueError("Unknown segment type: %s" % segmentType)
+		if smooth:
+			flags |= _smoothFlag
+		x, y = pt
+		if self._integers is None:
+			coordinates = self._coordinates
+			try:
+				coordinates.append(x)
+				coordinates.append(y)
+			except (TypeError, OverflowError):
+				self._addFloatCoordinates(x, y)
+		else:
+			self._addFloatCoordinates(x, y)
+		self._flags.append(flags)
+		if name is not None or identifier is not None:
+			self._addPointAttributes(len(self._flags) - 1, name, identifier)
+
+	def _addFloatCoordinates(self, x, y):
+		coordinates = self._coordinates
+		integers = self._integers
+		if integers is None:
+			# x may have been added before y failed
+			if len(coordinates) % 2:
+				coordinates.pop()
+			integers = self._integers = array("B", [1]) * len(coordinates)
+			coordinates = self._coordinates = array("d", coordinates)
+		coordinates.append(x)
+		coordinates.append(y)
+		integers.append(not isinstance(x, float))
+		integers.append(not isinstance(y, float))
+
+	def _getCoordinates(self):
+		coordinates = self._coordinates
+		integers = self._integers
+		if integers is None:
+			return coordinates
+		return [int(value) if integer else value for value, integer in izip(coordinates, integers)]
+
+	def _addPointAttributes(self, index, name, identifier):
+		if name is not None:
+			if self._names is None:
+				self._names = {}
+			self._names[index] = name
+		if identifier is not None:
+			if self._identifiers is None:
+				self._identifiers = {}
+			self._identifiers[index] = identifier
+
+	def append(self, point):
+		(x, y), segmentType, smooth, name, identifier = point
+		self.addPoint((x, y), segmentType, smooth, name, identifier)
+
+	def getPointData(self):
+		"""
+		Get the point data as a tuple of parallel sequences:
+
+			(x values, y values, segment types, smooth flags, names, identifiers)
+
+		names and identifiers are dicts of point index : value
+		or None if no point has a name or an identifier.
+		"""
+		coordinates = self._getCoordinates()
+		flags = self._flags
+		return (
+			coordinates[0::2],
+			coordinates[1::2],
+			map(_flagSegmentTypes.__getitem__, flags),
+			map(_flagSmooth.__getitem__, flags),
+			self._names,
+			self._identifiers
+		)
+
+	def _getPoint(self, index):
+		coordinates = self._coordinates
+		x = coordinates[index * 2]
+		y = coordinates[index * 2 + 1]
+		integers = self._integers
+		if integers is not None:
+			if integers[index * 2]:
+				x = int(x)
+			if integers[index * 2 + 1]:
+				y = int(y)
+		flags = self._flags[index]
+		name = identifier = None
+		if self._names is not None:
+			name = self._names.get(index)
+		if self._identifiers is not None:
+			identifier = self._identifiers.get(index)
+		return ((x, y), _flagSegmentTypes[flags], _flagSmooth[flags], name, identifier)
+
+	def __len__(self):
+		return len(self._flags)
+
+	# geometry
+
+	def getBounds(self):
+		"""
+		Get the control box as (xMin, yMin, xMax, yMax)
+		or None if the contour has no points.
+		"""
+		if not self._coordinates:
+			return None
+		coordinates = self._getCoordinates()
+		xs = coordinates[0::2]
+		ys = coordinates[1::2]
+		return (min(xs), min(ys), max(xs), max(ys))
+
+	def transform(self, transformation):
+		"""
+		Get a new contour with the points transformed by the
+		given component transformation (xScale, xyScale,
+		yxScale, yScale, xOffset, yOffset). NumPy is used
+		if it is available. As with Python numbers, the new
+		coordinates are integers if the transformation values
+		and the x and y of the point are integers.
+		"""
+		xx, xy, yx, yy, dx, dy = transformation
+		coordinates = self._coordinates
+		integral = not [value for value in transformation if isinstance(value, float)]
+		if integral:
+			typecode = coordinates.typecode
+		else:
+			typecode = "d"
+		contour = Contour()
+		contour.identifier = self.identifier
+		contour._flags = array("B", self._flags)
+		if self._names is not None:
+			contour._names = dict(self._names)
+		if self._identifiers is not None:
+			contour._identifiers = dict(self._identifiers)
+		if not coordinates:
+			pass
+		elif numpy is not None:
+			points = numpy.frombuffer(coordinates, dtype=coordinates.typecode).reshape(-1, 2)
+			points = points.dot(numpy.array([[xx, xy], [yx, yy]], dtype=typecode)) + numpy.array([dx, dy], dtype=typecode)
+			contour._coordinates = array(typecode, points.astype(typecode).tostring())
+		else:
+			xs = coordinates[0::2]
+			ys = coordinates[1::2]
+			transformed = array(typecode, coordinates)
+			transformed[0::2] = array(typecode, [xx * x + yx * y + dx for x, y in izip(xs, ys)])
+			transformed[1::2] = array(typecode, [xy * x + yy * y + dy for x, y in izip(xs, ys)])
+			contour._coordinates = transformed
+		integers = self._integers
+		if not integral:
+			contour._integers = array("B", [0]) * len(coordinates)
+		elif integers is not None:
+			# a new coordinate is an integer if both
+			# coordinates of the point are integers
+			points = [x and y for x, y in izip(integers[0::2], integers[1::2])]
+			contour._integers = array("B", [integer for integer in points for i in (0, 1)])
+		return contour
+
+	def __iter__(self):
+		xs, ys, segmentTypes, smooths, names, identifiers = self.getPointData()
+		count = len(segmentTypes)
+		if names is None:
+			names = repeat(None)
+		else:
+			names = map(names.get, xrange(count))
+		if identifiers is None:
+			identifiers = repeat(None)
+		else:
+			identifiers = map(identifiers.get, xrange(count))
+		return izip(izip(xs, ys), segmentTypes, smooths, names, identifiers)
+
+	def __getitem__(self, index):
+		count = len(self._flags)
+		if index < 0:
+			index += count
+		if not 0 <= index < count:
+			raise IndexError("Contour index out of range.")
+		return self._getPoint(index)
+
+	def __eq__(self, other):
+		if not isinstance(other, Contour):
+			return NotImplemented
+		return self.identifier == other.identifier and list(self) == list(other)
+
+	def __ne__(self, other):
+		result = self.__eq__(other)
+		if result is NotImplemented:
+			return result
+		return not result
+
+	def __getstate__(self):
+		# arrays are pickled as lists, so they are
+		# converted to strings to keep the data compact
+		coordinates = self._coordinates
+		integers = self._integers
+		if integers is not None:
+			integers = integers.tostring()
+		return (self.identifier, coordinates.typecode, coordinates.tostring(), integers, self._flags.tostring(), self._names, self._identifiers)
+
+	def __setstate__(self, state):
+		self.identifier, typecode, coordinates, integers, flags, self._names, self._identifiers = state
+		self._coordinates = array(typecode, coordinates)
+		self._integers = None
+		if integers is not None:
+			self._integers = array("B", integers)
+		self._flags = array("B", flags)
+
+
+_segmentTypes = [None, "move", "line", "offcurve", "curve", "qcurve"]
+_segmentTypeFlags = {segmentType : index for index, segmentType in enumerate(_segmentTypes)}
+_smoothFlag = 0x8
+# the values for each possible flags byte
+_flagSegmentTypes = [None] * 256
+_flagSmooth = [False] * 256
+for _flags in range(len(_segmentTypes)):
+	_flagSegmentTypes[_flags] = _flagSegmentTypes[_flags | _smoothFlag] = _segmentTypes[_flags]
+	_flagSmooth[_flags | _smoothFlag] = True
+del _flags
+
+# Component references are stored as dicts of form:
+# {
+#     base glyph name : set([composite glyph names])
+# }
+
+def _addComponentReferences(references, glyphName, baseGlyphNames):
+	for baseGlyphName in baseGlyphNames:
+		if baseGlyphName not in references:
+			references[baseGlyphName] = set()
+		references[baseGlyphName].add(glyphName)
+
+def _removeComponentReferences(references, glyphName, baseGlyphNames):
+	for baseGlyphName in baseGlyphNames:
+		glyphNames = references.get(baseGlyphName)
+		if glyphNames is None:
+			continue
+		glyphNames.discard(glyphName)
+		if not glyphNames:
+			del references[baseGlyphName]
+
+def _collectDependentGlyphNames(references, glyphName):
+	"""
+	Collect the names of the glyphs that use the glyph
+	with the given name, directly or indirectly.
+	"""
+	found = set()
+	stack = [glyphName]
+	while stack:
+		for dependentGlyphName in references.get(stack.pop(), ()):
+			if dependentGlyphName not in found:
+				found.add(dependentGlyphName)
+				stack.append(dependentGlyphName)
+	found.discard(glyphName)
+	return found
+
+_identityTransformation = (1, 0, 0, 1, 0, 0)
+
+def _transformDecomposition(entry, transformation):
+	if not transformation:
+		transformation = _identityTransformation
+	transformation = tuple(transformation)
+	if transformation == _identityTransformation:
+		return entry["contours"]
+	transformed = entry["transformed"]
+	if transformation not in transformed:
+		transformed[transformation] = [contour.transform(transformation) for contour in entry["contours"]]
+	return transformed[transformation]
+
+def _unionBounds(bounds):
+	bounds = [b for b in bounds if b is not None]
+	if not bounds:
+		return None
+	xMins, yMins, xMaxs, yMaxs = zip(*bounds)
+	return (min(xMins), min(yMins), max(xMaxs), max(yMaxs))
+
 
+# Estimated memory use of the glyph objects. The values
+# are the sizes of the objects that are created for a
+# glyph. The point size is the size of the coordinates
+# and the flags in the contour arrays.
 
-class Contour(list):
+_glyphMemory = sys.getsizeof(Glyph()) + sys.getsizeof({}) + sys.getsizeof([]) * 5
+_contourMemory = sys.getsizeof(Contour()) + sys.getsizeof(array("d")) + sys.getsizeof(array("B"))
+_pointMemory = array("d").itemsize * 2 + array("B").itemsize
+_componentMemory = sys.getsizeof(("", (1, 0, 0, 1, 0, 0), None)) + sys.getsizeof((1, 0, 0, 1, 0, 0)) + 8
 
-	identifier = None
+def _estimateGlyphMemory(glyph):
+	size = _glyphMemory
+	for contour in glyph.contours:
+		size += _contourMemory + _pointMemory * len(contour)
+	size += _componentMemory * len(glyph.components)
+	return size
@@ -0,0 +1,268 @@
+"""
+Property List reading and writing directly from and to strings.
+
+This reads property list data incrementally and builds
+the dicts, lists and scalars straight from the parser
+events without keeping the element tree. The result
+is identical to reading with plistTree.convertTreeToPlist.
+
+This writes property list data by formatting the objects
+straight into strings. The output is identical to writing
+a tree with plistTree.convertPlistToTree and serializing
+it with xmlUtilities.treeToString.
+"""
+
+import base64
+import datetime
+from cStringIO import StringIO
+from plistlib import Data
+from environment import ET
+from plistTree import plistHeader, dateFormat
+from xmlUtilities import escapeText, decodeString
+
+# -------
+# Reading
+# -------
+
+def readPlistFromString(data):
+	"""
+	Read a property list from the given string.
+
+	The elements are converted as soon as they have been
+	parsed and they are then removed from their parent,
+	so the tree for the entire property list is never built.
+	"""
+	root = None
+	container = None
+	key = None
+	stack = []
+	elements = []
+	for event, element in ET.iterparse(StringIO(data), events=("start", "end")):
+		tag = element.tag
+		if event == "start":
+			if tag == "dict":
+				obj = {}
+			elif tag == "array":
+				obj = []
+			else:
+				if tag == "plist":
+					elements.append(element)
+				continue
+		else:
+			if tag == "dict" or tag == "array":
+				container = stack.pop()
+				key = None
+				elements.pop()
+				if elements:
+					del elements[-1][:]
+				continue
+			if elements:
+				del elements[-1][:]
+			if tag == "key":
+				key = (element.text or "").strip()
+				continue
+			converter = _textConverters.get(tag)
+			if converter is None:
+				if tag == "plist":
+					continue
+				raise ValueError("Unknown element in property list: %s" % tag)
+			obj = converter(element.text or "")
+		if container is None:
+			root = obj
+		elif key is not None:
+			container[key] = obj
+			key = None
+		else:
+			container.append(obj)
+		if event == "start":
+			stack.append(container)
+			container = obj
+			elements.append(element)
+	return root
+
+
+class PlistBuilder(object):
+
+	"""
+	This builds property list objects from parser events
+	for property lists that are embedded in other documents,
+	such as the lib of a GLIF. The interface is the same as the one of ElementTree's
+	TreeBuilder, so it can be fed by any event source:
+
+		start(tag, attrs)
+		data(text)
+		end(tag)
+		close() -> the top level object
+
+	If an expat parser is given, the builder will set the
+	character data handler of the parser itself so that
+	only the text of the scalar elements is collected. The
+	whitespace between the elements is the majority of the
+	character data events, and skipping it is significantly
+	faster.
+
+	The text must be UTF-8 encoded strings or unicode strings.
+	Elements that do not belong to the property list
+	(the <plist> element or the <lib> element of a GLIF)
+	are ignored if they do not contain text.
+	"""
+
+	def __init__(self, parser=None):
+		self.parser = parser
+		self.stack = []
+		self.container = None
+		self.key = None
+		self.text = []
+		self.root = None
+
+	def start(self, tag, attrs):
+		if tag == "dict":
+			obj = {}
+		elif tag == "array":
+			obj = []
+		else:
+			self.text = text = []
+			if self.parser is not None:
+				self.parser.CharacterDataHandler = text.append
+			return
+		self._add(obj)
+		self.stack.append((self.container, self.key))
+		self.container = obj
+		self.key = None
+
+	def data(self, text):
+		self.text.append(text)
+
+	def end(self, tag):
+		if tag == "dict" or tag == "array":
+			self.container, self.key = self.stack.pop()
+			return
+		if self.parser is not None:
+			self.parser.CharacterDataHandler = None
+		text = "".join(self.text)
+		self.text = []
+		if tag == "key":
+			self.key = decodeString(text).strip()
+			return
+		converter = _textConverters.get(tag)
+		if converter is None:
+			if not text.strip():
+				return
+			raise ValueError("Unknown element in property list: %s" % tag)
+		self._add(converter(text))
+
+	def _add(self, obj):
+		container = self.container
+		if container is None:
+			self.root = obj
+		elif self.key is not None:
+			container[self.key] = obj
+			self.key = None
+		else:
+			container.append(obj)
+
+	def close(self):
+		return self.root
+
+
+def _readString(text):
+	if isinstance(text, unicode):
+		return text
+	return text.decode("utf-8")
+
+def _readData(text):
+	return Data(base64.b64decode(text))
+
+def _readDate(text):
+	return datetime.datetime.strptime(text.strip(), dateFormat)
+
+_textConverters = {
+	"string" : _readString,
+	"integer" : int,
+	"real" : float,
+	"true" : lambda text: True,
+	"false" : lambda text: False,
+	"data" : _readData,
+	"date" : _readDate,
+}
+
+# -------
+# Writing
+# -------
+
+def writePlistToString(obj, header=plistHeader, compact=False):
+	"""
+	Write a property list to a string. If header
+	is given, it will be inserted at the beginning
+	of the string. If compact is True, the data
+	will not be indented.
+	"""
+	parts = []
+	if header is not None:
+		parts.append(header + "\n")
+	parts.append("<plist version=\"1.0\">")
+	writeObjectToStream(obj, parts.append, level=1, compact=compact)
+	if compact:
+		parts.append("</plist>")
+	else:
+		parts.append("\n</plist>\n")
+	return "".join(parts)
+
+def writeObjectToStream(obj, write, level=0, compact=False):
+	"""
+	Write a property list object by passing the XML data,
+	in pieces, to the given write function. The object is
+	written on a new line indented by level tabs. If compact
+	is True, the object is written without the new line and
+	the indentation.
+	"""
+	if compact:
+		indent = ""
+	else:
+		indent = "\n" + "\t" * level
+	if isinstance(obj, dict):
+		items = [(key, value) for key, value in sorted(obj.items()) if value is not None]
+		if not items:
+			write(indent + "<dict />")
+			return
+		write(indent + "<dict>")
+		if compact:
+			subIndent = ""
+		else:
+			subIndent = indent + "\t"
+		for key, value in items:
+			assert isinstance(key, basestring)
+			write(_textElement(subIndent, "key", escapeText(key)))
+			writeObjectToStream(value, write, level + 1, compact)
+		write(indent + "</dict>")
+	elif isinstance(obj, (list, tuple)):
+		if not obj:
+			write(indent + "<array />")
+			return
+		write(indent + "<array>")
+		for value in obj:
+			writeObjectToStream(value, write, level + 1, compact)
+		write(indent + "</array>")
+	elif isinstance(obj, basestring):
+		write(_textElement(indent, "string", escapeText(obj)))
+	elif isinstance(obj, bool):
+		if obj:
+			write(indent + "<true />")
+		else:
+			write(indent + "<false />")
+	elif isinstance(obj, (int, long)):
+		write(_textElement(indent, "integer", str(obj)))
+	elif isinstance(obj, float):
+		write(_textElement(indent, "real", str(obj)))
+	elif isinstance(obj, Data):
+		write(_textElement(indent, "data", base64.b64encode(obj.data)))
+	elif isinstance(obj, datetime.datetime):
+		write(_textElement(indent, "date", obj.strftime(dateFormat)))
+	else:
+		raise TypeError("Unsupported type in property list: %r" % type(obj))
+
+def _textElement(indent, tag, text):
+	# empty elements are written as ElementTree writes them
+	if text:
+		return "%s<%s>%s</%s>" % (indent, tag, text, tag)
+	return "%s<%s />" % (indent, tag)
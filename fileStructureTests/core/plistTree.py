@@ -1,3 +1,6 @@
+import base64
+import datetime
+from plistlib import Data
 from environment import ET
 from xmlUtilities import treeToString
 
@@ -25,6 +28,8 @@ plistHeader = """
 <!DOCTYPE plist PUBLIC "-//Apple Computer//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
 """.strip()
 
+dateFormat = "%Y-%m-%dT%H:%M:%SZ"
+
 # -------
 # Support
 # -------
@@ -45,9 +50,12 @@ def _convertElementToObj(element):
 		return False
 	elif tag == "true":
 		return True
-	# XXX data, date
+	elif tag == "data":
+		return _convertElementToData(element)
+	elif tag == "date":
+		return _convertElementToDate(element)
 	else:
-		print tag
+		raise ValueError("Unknown element in property list: %s" % tag)
 
 def _convertObjToElement(obj):
 	if isinstance(obj, dict):
@@ -61,10 +69,16 @@ def _convertObjToElement(obj):
 			return ET.Element("false")
 		else:
 			return ET.Element("true")
-	elif isinstance(obj, int):
+	elif isinstance(obj, (int, long)):
 		return _convertIntToElement(obj)
 	elif isinstance(obj, float):
 		return _convertFloatToElement(obj)
+	elif isinstance(obj, Data):
+		return _convertDataToElement(obj)
+	elif isinstance(obj, datetime.datetime):
+		return _convertDateToElement(obj)
+	else:
+		raise TypeError("Unsupported type in property list: %r" % type(obj))
 
 def _convertElementToDict(element):
 	obj = {}
@@ -72,7 +86,7 @@ def _convertElementToDict(element):
 	for subElement in element:
 		tag = subElement.tag
 		if tag == "key":
-			currentKey = subElement.text.strip()
+			currentKey = (subElement.text or "").strip()
 		else:
 			obj[currentKey] = _convertElementToObj(subElement)
 			currentKey = None
@@ -125,9 +139,27 @@ def _convertFloatToElement(obj):
 	return element
 
 def _convertElementToString(element):
+	if element.text is None:
+		return u""
 	return unicode(element.text)
 
 def _convertStringToElement(obj):
 	element = ET.Element("string")
 	element.text = obj
 	return element
+
+def _convertElementToData(element):
+	return Data(base64.b64decode(element.text or ""))
+
+def _convertDataToElement(obj):
+	element = ET.Element("data")
+	element.text = base64.b64encode(obj.data)
+	return element
+
+def _convertElementToDate(element):
+	return datetime.datetime.strptime(element.text.strip(), dateFormat)
+
+def _convertDateToElement(obj):
+	element = ET.Element("date")
+	element.text = obj.strftime(dateFormat)
+	return element
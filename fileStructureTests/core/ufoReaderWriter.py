@@ -1,4 +1,7 @@
-from glyphTree import readGlyphFromTree, writeGlyphToTree
+import hashlib
+from objects import Glyph, Contour, _addComponentReferences, _removeComponentReferences, _collectDependentGlyphNames
+from glyphTree import readGlyphFromTree, writeGlyphToTree, _relaxedSetattr
+from glyphString import readGlyphFromString, readGlyphInfoFromString, writeGlyphToString
 
 
 class UFOReaderWriterError(Exception): pass
@@ -6,8 +9,13 @@ class UFOReaderWriterError(Exception): pass
 
 class UFOReaderWriter(object):
 
-	def __init__(self, fileSystem):
+	def __init__(self, fileSystem, glyphSetMetadata=False):
 		self._fileSystem = fileSystem
+		self._writesGlyphSetMetadata = glyphSetMetadata
+		self._glyphSetMetadata = {}
+		self._modifiedGlyphSetMetadata = set()
+		self._verifiedGlyphSetMetadata = {}
+		self._componentReferences = {}
 
 	def close(self):
 		"""
@@ -163,8 +171,175 @@ class UFOReaderWriter(object):
 	def writeGlyphSetContents(self, layerName):
 		"""
 		Write the glyph set contents for the given layer name.
+		If this object was created with glyphSetMetadata=True
+		and the glyph set metadata has been changed, it will
+		be written too.
 		"""
 		self._fileSystem.writeGlyphSetContents(layerName)
+		if not self._writesGlyphSetMetadata:
+			return
+		if layerName in self._glyphSetMetadata:
+			self._updateStaleGlyphSetMetadata(layerName, checkHashes=False)
+		if layerName in self._modifiedGlyphSetMetadata:
+			self._fileSystem.writeGlyphSetMetadata(layerName, self._glyphSetMetadata[layerName])
+			self._modifiedGlyphSetMetadata.remove(layerName)
+
+	def readGlyphSetMetadata(self, layerName, verify=False):
+		"""
+		Read the glyph set metadata for the given layer name.
+		This allows cmap, metrics and component dependency
+		data to be read without reading the glyphs. Returns
+		a dict of form:
+
+			{
+				glyph name : {
+					unicodes : [unicode values],
+					width : width,
+					height : height,
+					bounds : [xMin, yMin, xMax, yMax],
+					components : [base glyph names],
+					hash : hash
+				}
+			}
+
+		bounds is the control box of the contours and it
+		is not defined for glyphs without contours. hash
+		is the SHA-1 hex digest of the GLIF data as it is
+		stored. It is only defined if the file system stores
+		the glyphs as GLIF data.
+
+		The metadata is only written if this object was
+		created with glyphSetMetadata=True. It is then
+		updated whenever a glyph is written. Entries may
+		be stale if the glyphs were written by other
+		software. The first time an entry is used, the
+		raw data of the glyph is compared with the hash
+		and the entry is rebuilt from the glyph if they
+		differ. Entries without a hash are only rebuilt
+		if the glyph is missing from the metadata. If
+		verify is True, all glyphs are checked again
+		and the glyphs without a hash are read and
+		compared too. Rebuilt metadata is written by the
+		next writeGlyphSetContents call.
+		"""
+		self._updateStaleGlyphSetMetadata(layerName, verify)
+		return dict(self._getGlyphSetMetadata(layerName))
+
+	def _getGlyphSetMetadata(self, layerName):
+		metadata = self._glyphSetMetadata.get(layerName)
+		if metadata is None:
+			metadata = self._fileSystem.readGlyphSetMetadata(layerName)
+			if metadata is None:
+				metadata = {}
+			self._glyphSetMetadata[layerName] = metadata
+			self._verifiedGlyphSetMetadata[layerName] = set()
+		return metadata
+
+	def _needsGlyphMetadata(self, layerName):
+		# the entries are kept current if they will be
+		# written or if they have already been loaded
+		return self._writesGlyphSetMetadata or layerName in self._glyphSetMetadata
+
+	def _setGlyphMetadata(self, layerName, entries):
+		metadata = self._getGlyphSetMetadata(layerName)
+		verified = self._verifiedGlyphSetMetadata[layerName]
+		references = self._componentReferences.get(layerName)
+		for glyphName, entry in entries:
+			if references is not None:
+				if glyphName in metadata:
+					_removeComponentReferences(references, glyphName, metadata[glyphName]["components"])
+				_addComponentReferences(references, glyphName, entry["components"])
+			metadata[glyphName] = entry
+			verified.add(glyphName)
+		self._modifiedGlyphSetMetadata.add(layerName)
+
+	def _updateStaleGlyphSetMetadata(self, layerName, verify=False, checkHashes=True):
+		metadata = self._getGlyphSetMetadata(layerName)
+		verified = self._verifiedGlyphSetMetadata[layerName]
+		glyphNames = set(self._fileSystem.getGlyphNames(layerName))
+		changed = False
+		for glyphName in list(metadata.keys()):
+			if glyphName not in glyphNames:
+				del metadata[glyphName]
+				verified.discard(glyphName)
+				changed = True
+		if verify:
+			check = glyphNames
+		else:
+			check = glyphNames - set(metadata.keys())
+			if checkHashes:
+				check |= set(glyphName for glyphName in glyphNames - verified if "hash" in metadata.get(glyphName, ()))
+		for glyphName, entry in self._readGlyphMetadata(layerName, sorted(check), metadata):
+			verified.add(glyphName)
+			if metadata.get(glyphName) != entry:
+				metadata[glyphName] = entry
+				changed = True
+		if changed:
+			self._modifiedGlyphSetMetadata.add(layerName)
+			self._componentReferences.pop(layerName, None)
+
+	def _readGlyphMetadata(self, layerName, glyphNames, metadata):
+		"""
+		Yield (glyph name, entry) tuples for the given glyph
+		names. If the file system stores GLIF data, the data
+		is compared with the hash of the existing entry and
+		the glyph is only parsed if they differ.
+		"""
+		fileSystem = self._fileSystem
+		if fileSystem.storesGlyphObjects or not fileSystem.storesBytes:
+			for glyphName, glyph in self.readGlyphs(layerName, glyphNames, Glyph):
+				yield glyphName, _makeGlyphMetadata(glyph)
+			return
+		missing = []
+		for glyphName, data in fileSystem.readGlyphsBytes(layerName, glyphNames):
+			if data is None:
+				missing.append(glyphName)
+				continue
+			entry = metadata.get(glyphName)
+			if entry is None or entry.get("hash") != hashlib.sha1(data).hexdigest():
+				glyph = Glyph()
+				readGlyphFromString(data, glyph, glyph)
+				entry = _makeGlyphMetadata(glyph, data)
+			yield glyphName, entry
+		for glyphName, tree in fileSystem.readGlyphs(layerName, missing):
+			glyph = Glyph()
+			readGlyphFromTree(tree, glyph, glyph)
+			yield glyphName, _makeGlyphMetadata(glyph)
+
+	def getComponentReferences(self, layerName):
+		"""
+		Get the reverse component graph for the given layer
+		name. Returns a dict of form:
+
+			{
+				base glyph name : set([composite glyph names])
+			}
+
+		The graph is built from the glyph set metadata, so the
+		glyphs are only read if the metadata is stale. It is
+		kept current as glyphs are written.
+		"""
+		references = self._getComponentReferences(layerName)
+		return {baseGlyphName : set(glyphNames) for baseGlyphName, glyphNames in references.items()}
+
+	def getDependentGlyphNames(self, layerName, glyphName):
+		"""
+		Get a set of the names of the glyphs in the given layer
+		that use the given glyph as a component, directly or
+		through nested components.
+		"""
+		references = self._getComponentReferences(layerName)
+		return _collectDependentGlyphNames(references, glyphName)
+
+	def _getComponentReferences(self, layerName):
+		references = self._componentReferences.get(layerName)
+		if references is None:
+			self._updateStaleGlyphSetMetadata(layerName)
+			references = {}
+			for glyphName, entry in self._getGlyphSetMetadata(layerName).items():
+				_addComponentReferences(references, glyphName, entry["components"])
+			self._componentReferences[layerName] = references
+		return references
 
 	def getGlyphNames(self, layerName):
 		"""
@@ -174,17 +349,410 @@ class UFOReaderWriter(object):
 
 	def readGlyph(self, layerName, glyphName, glyphObject):
 		"""
-		Read a glyph from a layer.
+		Read a glyph from a layer. If the file system has
+		the raw GLIF data, it is parsed directly into the
+		glyph without building a tree.
 		"""
-		tree = self._fileSystem.readGlyph(layerName, glyphName)
-		readGlyphFromTree(tree, glyphObject, glyphObject)
+		if self._fileSystem.storesGlyphObjects:
+			self._fileSystem.readGlyphObject(layerName, glyphName, glyphObject, glyphObject)
+			return
+		data = self._fileSystem.readGlyphBytes(layerName, glyphName)
+		if data is not None:
+			readGlyphFromString(data, glyphObject, glyphObject)
+		else:
+			tree = self._fileSystem.readGlyph(layerName, glyphName)
+			readGlyphFromTree(tree, glyphObject, glyphObject)
+
+	def readGlyphs(self, layerName, glyphNames, glyphFactory):
+		"""
+		Read several glyphs from a layer. This is a generator
+		of (glyph name, glyph object) tuples. glyphFactory
+		will be called without arguments to create each glyph
+		object. The glyphs are read in batches by the file
+		system, so they may be yielded in any order.
+		"""
+		fileSystem = self._fileSystem
+		if fileSystem.storesGlyphObjects:
+			for glyphName in glyphNames:
+				glyphObject = glyphFactory()
+				fileSystem.readGlyphObject(layerName, glyphName, glyphObject, glyphObject)
+				yield glyphName, glyphObject
+			return
+		missing = []
+		for glyphName, data in fileSystem.readGlyphsBytes(layerName, glyphNames):
+			if data is None:
+				missing.append(glyphName)
+				continue
+			glyphObject = glyphFactory()
+			readGlyphFromString(data, glyphObject, glyphObject)
+			yield glyphName, glyphObject
+		for glyphName, tree in fileSystem.readGlyphs(layerName, missing):
+			glyphObject = glyphFactory()
+			readGlyphFromTree(tree, glyphObject, glyphObject)
+			yield glyphName, glyphObject
+
+	def readGlyphsParallel(self, layerName, glyphNames, glyphFactory, pool, chunkSize=100):
+		"""
+		Read several glyphs from a layer with the GLIF data
+		parsed by the worker processes of the given
+		multiprocessing pool. This is a generator of (glyph
+		name, glyph object) tuples, like readGlyphs.
+
+		The raw GLIF data is read by the file system in this
+		process and it is sent to the workers in chunks of
+		chunkSize glyphs. The workers send back compact
+		records with the outlines packed into strings and
+		the glyph objects are built from them in this process,
+		so glyphFactory does not need to be picklable. The
+		glyphs of file systems that store glyph objects and
+		the glyphs that are only available as trees are read
+		in this process.
+		"""
+		fileSystem = self._fileSystem
+		if fileSystem.storesGlyphObjects:
+			for glyphName, glyphObject in self.readGlyphs(layerName, glyphNames, glyphFactory):
+				yield glyphName, glyphObject
+			return
+		# the data is read before the chunks are given to the
+		# pool because the pool sends them from another thread
+		# and file systems may not allow that
+		missing = []
+		chunks = []
+		chunk = []
+		for glyphName, data in fileSystem.readGlyphsBytes(layerName, glyphNames):
+			if data is None:
+				missing.append(glyphName)
+				continue
+			chunk.append((glyphName, data))
+			if len(chunk) == chunkSize:
+				chunks.append(chunk)
+				chunk = []
+		if chunk:
+			chunks.append(chunk)
+		for records in pool.imap_unordered(_readGlyphRecordsFromStrings, chunks):
+			for glyphName, record in records:
+				glyphObject = glyphFactory()
+				_readGlyphFromRecord(record, glyphObject)
+				yield glyphName, glyphObject
+		for glyphName, tree in fileSystem.readGlyphs(layerName, missing):
+			glyphObject = glyphFactory()
+			readGlyphFromTree(tree, glyphObject, glyphObject)
+			yield glyphName, glyphObject
+
+	def readGlyphInfo(self, layerName, glyphName, fields=None):
+		"""
+		Read the data that precedes the outline of a glyph
+		from a layer. This is much faster than reading the
+		entire glyph when only the header data is needed.
+		Returns a dict of form:
+
+			{
+				field : value
+			}
+
+		The available fields are:
+
+			name
+			width
+			height
+			unicodes
+			anchors
+			note
+
+		If fields is None, all fields will be returned.
+		"""
+		if fields is None:
+			fields = glyphInfoFields
+		data = self._fileSystem.readGlyphInfo(layerName, glyphName, fields)
+		if data is not None:
+			return data
+		info = _GlyphInfo()
+		data = self._fileSystem.readGlyphBytes(layerName, glyphName)
+		if data is not None:
+			readGlyphInfoFromString(data, info)
+		else:
+			tree = self._fileSystem.readGlyph(layerName, glyphName)
+			readGlyphFromTree(tree, info)
+		return {field : getattr(info, field) for field in fields}
+
+	def findGlyphs(self, layerName, unicodeRange=None, baseGlyph=None, anchorName=None, hasNote=None, libKey=None):
+		"""
+		Find the glyphs in a layer that match all of the
+		given criteria and return a sorted list of their names.
+		The criteria are:
+
+			unicodeRange : (minimum, maximum) tuple. The glyph
+			               has a unicode value in the range,
+			               including the minimum and maximum.
+			baseGlyph    : The glyph has a component that
+			               references this glyph.
+			anchorName   : The glyph has an anchor with this name.
+			hasNote      : True or False. The glyph does or
+			               does not have a note.
+			libKey       : The glyph lib contains this key.
+
+		Criteria that are None are ignored. If the file system
+		can answer the query directly, it does so. Otherwise the
+		glyphs are scanned one at a time. Only the data preceding
+		the outline is parsed unless baseGlyph or libKey is given.
+		"""
+		query = dict(
+			unicodeRange=unicodeRange,
+			baseGlyph=baseGlyph,
+			anchorName=anchorName,
+			hasNote=hasNote,
+			libKey=libKey
+		)
+		query = {key : value for key, value in query.items() if value is not None}
+		glyphNames = self._fileSystem.findGlyphs(layerName, query)
+		if glyphNames is None:
+			glyphNames = [info.name for info in self._scanGlyphs(layerName, query) if _matchGlyphQuery(info, query)]
+		return sorted(glyphNames)
+
+	def _scanGlyphs(self, layerName, query):
+		"""
+		Yield a _GlyphQueryInfo for each glyph in a layer
+		with the data needed to evaluate the given query.
+		"""
+		fileSystem = self._fileSystem
+		glyphNames = fileSystem.getGlyphNames(layerName)
+		if "baseGlyph" in query or "libKey" in query:
+			# the outline and the lib are needed
+			for glyphName, info in self.readGlyphs(layerName, glyphNames, _GlyphQueryInfo):
+				info.name = glyphName
+				yield info
+			return
+		if fileSystem.storesGlyphObjects:
+			for glyphName in glyphNames:
+				info = _GlyphQueryInfo()
+				fileSystem.readGlyphObject(layerName, glyphName, info, None)
+				info.name = glyphName
+				yield info
+			return
+		missing = []
+		for glyphName, data in fileSystem.readGlyphsBytes(layerName, glyphNames):
+			if data is None:
+				missing.append(glyphName)
+				continue
+			info = _GlyphQueryInfo()
+			readGlyphInfoFromString(data, info)
+			info.name = glyphName
+			yield info
+		for glyphName, tree in fileSystem.readGlyphs(layerName, missing):
+			info = _GlyphQueryInfo()
+			readGlyphFromTree(tree, info)
+			info.name = glyphName
+			yield info
 
 	def writeGlyph(self, layerName, glyphName, glyphObject):
 		"""
 		Write a glyph from a layer.
 		"""
-		tree = writeGlyphToTree(glyphObject)
-		self._fileSystem.writeGlyph(layerName, glyphName, tree)
+		data = None
+		if self._fileSystem.storesGlyphObjects:
+			self._fileSystem.writeGlyphObject(layerName, glyphName, glyphObject)
+		elif self._fileSystem.storesBytes:
+			data = writeGlyphToString(glyphObject, compact=self._fileSystem.compact)
+			self._fileSystem.writeGlyphBytes(layerName, glyphName, data)
+		else:
+			tree = writeGlyphToTree(glyphObject)
+			self._fileSystem.writeGlyph(layerName, glyphName, tree)
+		if self._needsGlyphMetadata(layerName):
+			self._setGlyphMetadata(layerName, [(glyphName, _makeGlyphMetadata(glyphObject, data))])
+
+	def writeGlyphs(self, layerName, glyphs):
+		"""
+		Write several glyphs to a layer as one batch.
+		glyphs must be an iterable of (glyph name,
+		glyph object) tuples. If the file system supports
+		transactions, either the entire batch or, if an
+		error occurs, none of it will be written.
+		"""
+		fileSystem = self._fileSystem
+		# the metadata is only updated after the entire
+		# batch has been written
+		needsMetadata = self._needsGlyphMetadata(layerName)
+		entries = []
+		if fileSystem.storesGlyphObjects:
+			glyphs = list(glyphs)
+			fileSystem.writeGlyphObjects(layerName, glyphs)
+			if needsMetadata:
+				entries = [(glyphName, _makeGlyphMetadata(glyphObject)) for glyphName, glyphObject in glyphs]
+		elif fileSystem.storesBytes:
+			compact = fileSystem.compact
+			def serialize():
+				for glyphName, glyphObject in glyphs:
+					data = writeGlyphToString(glyphObject, compact=compact)
+					if needsMetadata:
+						entries.append((glyphName, _makeGlyphMetadata(glyphObject, data)))
+					yield glyphName, data
+			fileSystem.writeGlyphsBytes(layerName, serialize())
+		else:
+			def serialize():
+				for glyphName, glyphObject in glyphs:
+					if needsMetadata:
+						entries.append((glyphName, _makeGlyphMetadata(glyphObject)))
+					yield glyphName, writeGlyphToTree(glyphObject)
+			fileSystem.writeGlyphs(layerName, serialize())
+		if needsMetadata:
+			self._setGlyphMetadata(layerName, entries)
+
+
+glyphInfoFields = "name width height unicodes anchors note".split(" ")
+
+# Glyph records are sent from the worker processes of
+# UFOReaderWriter.readGlyphsParallel as tuples of form:
+# (
+#     [(attribute, value)],
+#     [contour state],
+#     [(base glyph name, transformation, identifier)]
+# )
+# The attributes are only listed if the GLIF data set
+# them. The contour states are the pickle states of
+# Contour objects, so the points are packed into strings.
+
+_glyphRecordAttributes = [attr for attr in Glyph.__slots__ if not attr.startswith("_") and attr not in ("dirty", "contours", "components")]
+_defaultGlyph = Glyph()
+
+def _readGlyphRecordsFromStrings(chunk):
+	"""
+	Parse a chunk of GLIF data into glyph records
+	in a worker process.
+	"""
+	records = []
+	for glyphName, data in chunk:
+		glyph = Glyph()
+		readGlyphFromString(data, glyph, glyph)
+		attributes = []
+		for attr in _glyphRecordAttributes:
+			value = getattr(glyph, attr)
+			if value != getattr(_defaultGlyph, attr):
+				attributes.append((attr, value))
+		contours = [contour.__getstate__() for contour in glyph.contours]
+		records.append((glyphName, (attributes, contours, glyph.components)))
+	return records
+
+def _readGlyphFromRecord(record, glyphObject):
+	"""
+	Build a glyph object from a glyph record. The contours
+	are given to Glyph objects directly and drawn into any
+	other glyph object with the point pen protocol.
+	"""
+	attributes, contourStates, components = record
+	for attr, value in attributes:
+		_relaxedSetattr(glyphObject, attr, value)
+	contours = []
+	for state in contourStates:
+		contour = Contour.__new__(Contour)
+		contour.__setstate__(state)
+		contours.append(contour)
+	if isinstance(glyphObject, Glyph):
+		if contours:
+			glyphObject.contours = contours
+		if components:
+			glyphObject.components = components
+		return
+	for contour in contours:
+		glyphObject.beginPath(identifier=contour.identifier)
+		for pt, segmentType, smooth, name, identifier in contour:
+			glyphObject.addPoint(pt, segmentType=segmentType, smooth=smooth, name=name, identifier=identifier)
+		glyphObject.endPath()
+	for baseGlyphName, transformation, identifier in components:
+		glyphObject.addComponent(baseGlyphName, transformation, identifier=identifier)
+
+def _makeGlyphMetadata(glyphObject, data=None):
+	"""
+	Make the glyph set metadata entry for a glyph. If given,
+	data must be the GLIF data of the glyph as it is stored.
+	The entry only has a hash if data is given.
+	"""
+	metadata = dict(
+		unicodes=list(glyphObject.unicodes),
+		width=glyphObject.width,
+		height=glyphObject.height,
+		components=[baseGlyphName for baseGlyphName, transformation, identifier in glyphObject.components]
+	)
+	if data is not None:
+		metadata["hash"] = hashlib.sha1(data).hexdigest()
+	getBounds = getattr(glyphObject, "getBounds", None)
+	if getBounds is not None:
+		bounds = getBounds()
+	else:
+		bounds = _getContourBounds(glyphObject.contours)
+	if bounds is not None:
+		metadata["bounds"] = list(bounds)
+	return metadata
+
+def _getContourBounds(contours):
+	xs = []
+	ys = []
+	for contour in contours:
+		for (x, y), segmentType, smooth, name, identifier in contour:
+			xs.append(x)
+			ys.append(y)
+	if not xs:
+		return None
+	return (min(xs), min(ys), max(xs), max(ys))
+
+class _GlyphInfo(object):
+
+	"""
+	Container for the glyph data read by readGlyphInfo.
+	"""
+
+	def __init__(self):
+		self.name = None
+		self.width = 0
+		self.height = 0
+		self.unicodes = []
+		self.anchors = []
+		self.note = None
+
+
+class _GlyphQueryInfo(_GlyphInfo):
+
+	"""
+	Container for the glyph data read by findGlyphs.
+	This is also a point pen that only records the
+	base glyphs of the components.
+	"""
+
+	def __init__(self):
+		super(_GlyphQueryInfo, self).__init__()
+		self.baseGlyphs = set()
+		self.lib = {}
+
+	def beginPath(self, identifier=None, **kwargs):
+		pass
+
+	def endPath(self):
+		pass
+
+	def addPoint(self, pt, segmentType=None, smooth=False, name=None, identifier=None, **kwargs):
+		pass
+
+	def addComponent(self, baseGlyphName, transformation, identifier=None, **kwargs):
+		self.baseGlyphs.add(baseGlyphName)
+
+
+def _matchGlyphQuery(info, query):
+	if "unicodeRange" in query:
+		minimum, maximum = query["unicodeRange"]
+		if not any(minimum <= value <= maximum for value in info.unicodes):
+			return False
+	if "baseGlyph" in query:
+		if query["baseGlyph"] not in info.baseGlyphs:
+			return False
+	if "anchorName" in query:
+		if not any(anchor.get("name") == query["anchorName"] for anchor in info.anchors):
+			return False
+	if "hasNote" in query:
+		if bool(info.note) != bool(query["hasNote"]):
+			return False
+	if "libKey" in query:
+		if query["libKey"] not in info.lib:
+			return False
+	return True
 
 
 fontInfoAttributes = """
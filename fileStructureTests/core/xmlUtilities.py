@@ -4,9 +4,12 @@ Miscellaneous XML tools.
 
 from environment import ET
 
-def treeToString(tree, header):
-    indentTree(tree)
-    xml = ET.tostring(tree)
+def treeToString(tree, header, compact=False):
+    if compact:
+        xml = compactTreeToString(tree)
+    else:
+        indentTree(tree)
+        xml = ET.tostring(tree)
     if header is not None:
         xml = header.splitlines() + [xml]
         xml = "\n".join(xml)
@@ -26,4 +29,85 @@ def indentTree(elem, whitespace="\t", level=0):
             elem.tail = i
     else:
         if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
\ No newline at end of file
+            elem.tail = i
+
+def compactTreeToString(tree):
+    """
+    Serialize a tree without indentation. Text and tails
+    that only contain whitespace are dropped, except for
+    the text of elements without children. Otherwise, the
+    output is the same as the output of ElementTree.
+
+    The tree is walked iteratively, so the depth of the
+    tree is not limited by the recursion limit.
+    """
+    parts = []
+    write = parts.append
+    stack = [(None, iter([tree]))]
+    while stack:
+        parent, children = stack[-1]
+        for element in children:
+            tag = element.tag
+            write("<" + tag)
+            for attr, value in sorted(element.attrib.items()):
+                write(" %s=\"%s\"" % (attr, escapeAttribute(value)))
+            text = element.text
+            if len(element):
+                write(">")
+                if text and text.strip():
+                    write(escapeText(text))
+                stack.append((element, iter(element)))
+                break
+            elif text:
+                write(">" + escapeText(text) + "</" + tag + ">")
+            else:
+                write(" />")
+            tail = element.tail
+            if tail and tail.strip():
+                write(escapeText(tail))
+        else:
+            stack.pop()
+            if parent is not None:
+                write("</" + parent.tag + ">")
+                tail = parent.tail
+                if tail and tail.strip():
+                    write(escapeText(tail))
+    return "".join(parts)
+
+def escapeText(text):
+    # this matches the escaping done by ElementTree
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text.encode("us-ascii", "xmlcharrefreplace")
+
+def escapeAttribute(text):
+    # this matches the escaping done by ElementTree
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    return text.encode("us-ascii", "xmlcharrefreplace")
+
+def decodeString(s):
+    """
+    Decode a UTF-8 string returned by expat. ASCII
+    strings are returned as they are, just as they
+    are by ElementTree.
+    """
+    if s is None:
+        return None
+    try:
+        s.decode("ascii")
+        return s
+    except UnicodeDecodeError:
+        return s.decode("utf-8")
@@ -13,39 +13,164 @@ This implements one big XML file. This is the schema:
 	<glyphs name="text">
 		<glyph name="text"> glif </glyph>
 	</glyphs>
+	<metadata name="text"> plist </metadata>
 </font>
+
+When the file is opened, it is scanned for the byte ranges
+of the top level elements and the glyph elements. In lazy
+mode, those elements are only parsed when they are requested.
 """
 
 import os
+import re
 from collections import OrderedDict
 from core.environment import ET
 from core.fileSystem import BaseFileSystem
-from core.plistTree import convertPlistToTree
+from core.plistTree import convertPlistToTree, convertTreeToPlist
+from core.xmlUtilities import compactTreeToString
 
 class SingleXMLFileSystem(BaseFileSystem):
 
 	fileExtension = 'xml'
+	storesBytes = False
 
-	def __init__(self, path):
-		super(SingleXMLFileSystem, self).__init__()
+	def __init__(self, path, lazy=False, compact=None):
+		super(SingleXMLFileSystem, self).__init__(compact=compact)
 		self.needFileWrite = False
 		self.path = path
+		self.lazy = lazy
+		self._data = None
+		self._rawRanges = {}
+		self._rawCompact = False
+		self._unparsedRanges = {}
 		if os.path.exists(path):
 			f = open(path, "rb")
 			data = f.read()
 			f.close()
-			self.tree = ET.fromstring(data)
+			scanned = _scanDocument(data)
+			if scanned is None:
+				self.tree = ET.fromstring(data)
+			else:
+				self.tree, self._rawRanges = scanned
+				self._unparsedRanges = dict(self._rawRanges)
+				self._data = data
+				self._rawCompact = _isCompactDocument(data, self._rawRanges)
+				if not lazy:
+					for element in list(self._unparsedRanges.keys()):
+						self._parseElement(element)
 		else:
 			self.tree = ET.Element("font")
+		self._buildIndexes()
+
+	def _parseElement(self, element):
+		"""
+		Parse the contents of an element found
+		during a lazy scan into the element.
+		"""
+		if element is not None:
+			r = self._unparsedRanges.pop(element, None)
+			if r is not None:
+				start, end = r
+				_replaceElement(element, ET.fromstring(self._data[start:end]))
+		return element
+
+	def _buildIndexes(self):
+		"""
+		Build the indexes that map locations to elements:
+
+			{
+				tag : element
+			}
+
+			{
+				layer name : element
+			}
+
+			{
+				(layer name, glyph name) : element
+			}
+
+			{
+				layer name : metadata element
+			}
+		"""
+		self._topLevelElements = {}
+		self._layerElements = OrderedDict()
+		self._glyphElements = {}
+		self._metadataElements = {}
+		for element in self.tree:
+			tag = element.tag
+			if tag == "glyphs":
+				layerName = element.attrib["name"]
+				self._layerElements[layerName] = element
+				for glyphElement in element:
+					glyphName = glyphElement.attrib["name"]
+					self._glyphElements[layerName, glyphName] = glyphElement
+			elif tag == "metadata":
+				self._metadataElements[element.attrib["name"]] = element
+			elif tag not in self._topLevelElements:
+				self._topLevelElements[tag] = element
 
 	def close(self):
 		if self.needFileWrite:
-			_indent(self.tree)
-			data = ET.tostring(self.tree)
 			f = open(self.path, "wb")
-			f.write(data)
+			self._writeDocument(f)
 			f.close()
 		self.needFileWrite = False
+		self._rawRanges = {}
+		self._unparsedRanges = {}
+		self._data = None
+
+	# -------
+	# Writing
+	# -------
+
+	"""
+	The document is written element by element to the file.
+	The output is identical to indenting the entire tree and
+	serializing it in one pass. Elements that have not been
+	written since the file was opened are copied from the
+	existing file without being serialized again if the
+	existing file has the same formatting. Otherwise they
+	are parsed and serialized again. In compact mode, the
+	elements are written without indentation.
+	"""
+
+	def _writeDocument(self, f):
+		root = self.tree
+		if not len(root):
+			f.write(ET.tostring(root))
+			return
+		if self.compact:
+			indents = _compactIndents
+		else:
+			indents = _prettyIndents
+		f.write(_startTag(root))
+		for element in root:
+			f.write(indents[1])
+			if element.tag == "glyphs" and len(element):
+				f.write(_startTag(element))
+				for glyphElement in element:
+					f.write(indents[2])
+					self._writeElement(f, glyphElement, 2)
+				f.write(indents[1] + "</glyphs>")
+			else:
+				self._writeElement(f, element, 1)
+		f.write(indents[0] + "</font>" + indents[0])
+
+	def _writeElement(self, f, element, level):
+		r = self._rawRanges.get(element)
+		if r is not None and self._rawCompact == bool(self.compact):
+			start, end = r
+			f.write(self._data[start:end])
+			return
+		self._parseElement(element)
+		if self.compact:
+			f.write(compactTreeToString(element))
+		else:
+			_indent(element, level=level)
+			element.tail = None
+			f.write(ET.tostring(element))
 
 	# ------------
 	# File Support
@@ -87,14 +212,14 @@ class SingleXMLFileSystem(BaseFileSystem):
 				return self._readGlyphFromLayer(location)
 		else:
 			tag = self._locationTags[location]
-			element = self.tree.find(tag)
-			return element
+			element = self._topLevelElements.get(tag)
+			return self._parseElement(element)
 
 	def _readGlyphFromLayer(self, location):
 		layerName = location["layer"]
 		glyphName = location["name"]
-		path = "glyphs[@name='%s']/glyph[@name='%s']" % (layerName, glyphName)
-		return self.tree.find(path)
+		element = self._glyphElements.get((layerName, glyphName))
+		return self._parseElement(element)
 
 	def writeTreeToLocation(self, tree, location, header=None):
 		self.needFileWrite = True
@@ -104,34 +229,35 @@ class SingleXMLFileSystem(BaseFileSystem):
 		else:
 			tag = self._locationTags[location]
 			tree.tag = tag
-			existing = self.tree.find(tag)
+			existing = self._topLevelElements.get(tag)
 			if existing is not None:
-				index = self.tree.getchildren().index(existing)
-				self.tree.remove(existing)
-				self.tree.insert(index, tree)
+				self._rawRanges.pop(existing, None)
+				self._unparsedRanges.pop(existing, None)
+				_replaceElement(existing, tree)
 			else:
 				self.tree.append(tree)
+				self._topLevelElements[tag] = tree
 
 	def _writeGlyphToLayer(self, tree, location):
 		layerName = location["layer"]
 		glyphName = location["name"]
 		# find the layer element
-		found = False
-		path = "glyphs[@name='%s']" % layerName
-		layerElement = self.tree.find(path)
+		layerElement = self._layerElements.get(layerName)
 		if layerElement is None:
 			layerElement = ET.Element("glyphs")
 			layerElement.attrib["name"] = layerName
 			self.tree.append(layerElement)
+			self._layerElements[layerName] = layerElement
 		# store the glyph
 		tree.tag = "glyph"
-		existing = layerElement.find("glyph[@name='%s']" % glyphName)
+		existing = self._glyphElements.get((layerName, glyphName))
 		if existing is not None:
-			index = layerElement.getchildren().index(existing)
-			layerElement.remove(existing)
-			layerElement.insert(index, tree)
+			self._rawRanges.pop(existing, None)
+			self._unparsedRanges.pop(existing, None)
+			_replaceElement(existing, tree)
 		else:
 			layerElement.append(tree)
+			self._glyphElements[layerName, glyphName] = tree
 
 	# ---------------
 	# Top Level Files
@@ -167,7 +293,7 @@ class SingleXMLFileSystem(BaseFileSystem):
 		# convert to an element
 		element = ET.Element("features")
 		element.text = tree
-		self.writeTreeToLocation(tree, "features.fea")
+		self.writeTreeToLocation(element, "features.fea")
 
 	# -----------------
 	# Layers and Glyphs
@@ -179,8 +305,7 @@ class SingleXMLFileSystem(BaseFileSystem):
 
 	def readLayerContents(self):
 		layerContents = OrderedDict()
-		for layerElement in self.tree.findall("glyphs"):
-			layerName = layerElement.attrib["name"]
+		for layerName in self._layerElements.keys():
 			layerContents[layerName] = layerName
 		return layerContents
 
@@ -193,7 +318,7 @@ class SingleXMLFileSystem(BaseFileSystem):
 
 	def readGlyphSetContents(self, layerName):
 		glyphSetContents = {}
-		layerElement = self.tree.find("glyphs[@name='%s']" % layerName)
+		layerElement = self._layerElements.get(layerName)
 		if layerElement is not None:
 			for glyphElement in layerElement.findall("glyph"):
 				glyphName = glyphElement.attrib["name"]
@@ -203,16 +328,165 @@ class SingleXMLFileSystem(BaseFileSystem):
 	def writeGlyphSetContents(self, layerName):
 		pass
 
+	"""
+	The glyph set metadata is stored in a <metadata>
+	element for each layer.
+	"""
+
+	def readGlyphSetMetadata(self, layerName):
+		element = self._parseElement(self._metadataElements.get(layerName))
+		if element is None:
+			return None
+		return convertTreeToPlist(element)
+
+	def writeGlyphSetMetadata(self, layerName, data):
+		self.needFileWrite = True
+		tree = convertPlistToTree(data)
+		tree.tag = "metadata"
+		tree.attrib["name"] = layerName
+		existing = self._metadataElements.get(layerName)
+		if existing is not None:
+			self._rawRanges.pop(existing, None)
+			self._unparsedRanges.pop(existing, None)
+			_replaceElement(existing, tree)
+		else:
+			self.tree.append(tree)
+			self._metadataElements[layerName] = tree
+
 	def readGlyph(self, layerName, glyphName):
 		path = dict(type="glyph", layer=layerName, name=glyphName)
 		tree = self.readTreeFromLocation(path)
 		return tree
 
+	def readGlyphBytes(self, layerName, glyphName):
+		element = self._glyphElements.get((layerName, glyphName))
+		r = self._rawRanges.get(element)
+		if r is None:
+			return None
+		start, end = r
+		return self._data[start:end]
+
 	def writeGlyph(self, layerName, glyphName, tree):
 		path = dict(type="glyph", layer=layerName, name=glyphName)
 		self.writeTreeToLocation(tree, path)
 
 
+# ---------
+# Lazy Scan
+# ---------
+
+_startTagPattern = re.compile(r"<([^\s/>!?]+)(?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*\s*(/?)>")
+
+def _isCompactDocument(data, ranges):
+	"""
+	Determine if a scanned document was written in compact
+	mode by looking for whitespace before its first element.
+	"""
+	if not ranges:
+		return False
+	start = min([start for start, end in ranges.values()])
+	return not data[start - 1].isspace()
+
+def _scanDocument(data):
+	"""
+	Scan the document for the top level elements,
+	the layer elements and the glyph elements without
+	parsing their contents. This returns a tuple of
+	the root element, containing empty elements with
+	the attributes of the scanned elements, and a dict
+	of form:
+
+		{
+			element : (start, end)
+		}
+
+	This relies on an element of the schema never being
+	nested within an element with the same tag. If the
+	document contains comments, CDATA sections, processing
+	instructions or anything else that can't be handled
+	by the scan, None will be returned.
+	"""
+	pos = 0
+	if data.startswith("<?"):
+		pos = data.index("?>") + 2
+	if data.find("<?", pos) != -1 or data.find("<!", pos) != -1:
+		return None
+	ranges = {}
+	try:
+		pos = data.index("<", pos)
+		root, pos, selfClosing = _scanStartTag(data, pos)
+		if selfClosing:
+			return root, ranges
+		while True:
+			pos = data.index("<", pos)
+			if data.startswith("</", pos):
+				break
+			element, end, selfClosing = _scanStartTag(data, pos)
+			root.append(element)
+			if element.tag == "glyphs" and not selfClosing:
+				pos = end
+				while True:
+					pos = data.index("<", pos)
+					if data.startswith("</", pos):
+						pos = data.index(">", pos) + 1
+						break
+					glyphElement, end, selfClosing = _scanStartTag(data, pos)
+					element.append(glyphElement)
+					end = _findElementEnd(data, glyphElement.tag, end, selfClosing)
+					ranges[glyphElement] = (pos, end)
+					pos = end
+			else:
+				end = _findElementEnd(data, element.tag, end, selfClosing)
+				ranges[element] = (pos, end)
+				pos = end
+	except (ValueError, SyntaxError):
+		return None
+	return root, ranges
+
+def _scanStartTag(data, pos):
+	match = _startTagPattern.match(data, pos)
+	if match is None:
+		raise ValueError("Unable to scan the tag at %d." % pos)
+	text = match.group(0)
+	selfClosing = bool(match.group(2))
+	if not selfClosing:
+		text = text[:-1] + "/>"
+	element = ET.fromstring(text)
+	return element, match.end(), selfClosing
+
+def _findElementEnd(data, tag, pos, selfClosing):
+	if selfClosing:
+		return pos
+	pos = data.index("</%s" % tag, pos)
+	return data.index(">", pos) + 1
+
+# -------
+# Support
+# -------
+
+_prettyIndents = ["\n" + "\t" * level for level in range(3)]
+_compactIndents = [""] * 3
+
+def _startTag(element):
+	"""
+	Serialize the start tag of an element.
+	"""
+	shell = ET.Element(element.tag, element.attrib)
+	text = ET.tostring(shell)
+	return text[:-len(" />")] + ">"
+
+def _replaceElement(existing, tree):
+	"""
+	Replace the contents of an existing element with the
+	contents of tree. The existing element keeps its position
+	in its parent, so the parent does not need to be searched.
+	"""
+	existing.clear()
+	existing.tag = tree.tag
+	existing.text = tree.text
+	existing.attrib.update(tree.attrib)
+	existing.extend(list(tree))
+
 def _indent(elem, whitespace="\t", level=0):
 	# taken from http://effbot.org/zone/element-lib.htm#prettyprint
 	i = "\n" + level * whitespace
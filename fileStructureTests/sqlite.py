@@ -4,6 +4,12 @@ UFO 3 sqlLite File System
 
 This implements an on-disk, compressed (sqlLite) package
 structure.
+
+The connection is configured with a named profile of
+pragmas. The profiles are stored as lists of
+(pragma, value) tuples because the order matters:
+page_size must be set before the database is created
+and before the journal mode is switched to WAL.
 """
 
 import os
@@ -14,14 +20,47 @@ from core.fileSystem import BaseFileSystem
 class SqliteFileSystem(BaseFileSystem):
 
     fileExtension = 'ufodb'
+    # the maximum number of locations in a single query
+    queryBatchSize = 500
+
+    profiles = {
+        # the SQLite defaults
+        "default" : [],
+        # write ahead logging with the recommended synchronous mode
+        "wal" : [
+            ("journal_mode", "WAL"),
+            ("synchronous", "NORMAL"),
+        ],
+        # safe writes with a moderate amount of memory
+        "laptop" : [
+            ("page_size", 4096),
+            ("journal_mode", "WAL"),
+            ("synchronous", "NORMAL"),
+            ("cache_size", -16384),
+            ("mmap_size", 67108864),
+        ],
+        # fast writes to files that can be rebuilt if the machine fails
+        "ci" : [
+            ("page_size", 8192),
+            ("journal_mode", "WAL"),
+            ("synchronous", "OFF"),
+            ("cache_size", -65536),
+            ("mmap_size", 268435456),
+        ],
+    }
+    profile = "default"
 
-    def __init__(self, path):
-        super(SqliteFileSystem, self).__init__()
+    def __init__(self, path, compact=None, profile=None):
+        super(SqliteFileSystem, self).__init__(compact=compact)
+        if profile is not None:
+            self.profile = profile
         self.path = path
         # connect to a db
         self.db = sqlite3.connect(self.path)
+        for pragma, value in self.profiles[self.profile]:
+            self.db.execute('PRAGMA %s=%s' % (pragma, value))
         # create the base table if is doenst exists yet
-        self.db.execute('CREATE TABLE IF NOT EXISTS data(location TEXT PRIMARY KEY, bytes TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS data(location TEXT PRIMARY KEY, bytes BLOB)')
         
     def close(self):
         # commit all changes to the db
@@ -47,18 +86,46 @@ class SqliteFileSystem(BaseFileSystem):
         cursor = self.db.execute('SELECT bytes FROM data WHERE location=?', (location,))
         data = cursor.fetchone()
         if data:
-            return data[0]
+            return _toBytes(data[0])
         return None
-        
+
     def writeBytesToLocation(self, data, location):
-        try:
-            self.db.execute('INSERT INTO data VALUES (?, ?)', (location, data))
-        except sqlite3.IntegrityError:
-            self.db.execute('UPDATE data SET bytes=? WHERE location=?', (data, location))
-        
-            
-        
+        self.db.execute(_upsert, (location, sqlite3.Binary(data)))
+
+    # -----------------
+    # Layers and Glyphs
+    # -----------------
+
+    def writeGlyphsBytes(self, layerName, glyphs):
+        # write the entire batch in its own transaction
+        rows = [(self.getGlyphLocation(layerName, glyphName), sqlite3.Binary(data)) for glyphName, data in glyphs]
+        self.db.commit()
+        with self.db:
+            self.db.executemany(_upsert, rows)
+
+    def readGlyphsBytes(self, layerName, glyphNames):
+        # read the glyphs with one query per batch of locations
+        locations = {}
+        for glyphName in glyphNames:
+            locations[self.getGlyphLocation(layerName, glyphName)] = glyphName
+        batch = list(locations.keys())
+        for i in range(0, len(batch), self.queryBatchSize):
+            subBatch = batch[i:i + self.queryBatchSize]
+            query = 'SELECT location, bytes FROM data WHERE location IN (%s)' % ', '.join(['?'] * len(subBatch))
+            for location, data in self.db.execute(query, subBatch).fetchall():
+                yield locations.pop(location), _toBytes(data)
+        for glyphName in locations.values():
+            yield glyphName, None
+
+
+_upsert = 'INSERT OR REPLACE INTO data VALUES (?, ?)'
 
+def _toBytes(data):
+    # files written before the bytes were stored
+    # as BLOB contain TEXT, which is read as unicode
+    if isinstance(data, unicode):
+        return data.encode("utf-8")
+    return str(data)
 
 
 if __name__ == "__main__":
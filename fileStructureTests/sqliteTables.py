@@ -0,0 +1,357 @@
+"""
+SQLite Tables File System
+-------------------------
+
+This implements an on-disk SQLite database in which the
+glyphs, the kerning and the groups are stored in normalized
+tables instead of as XML:
+
+layers(name, storageName, position)
+glyphs(id, layer, name, width, height, note, image, lib)
+unicodes(glyph, position, code)
+contours(glyph, position, identifier)
+points(glyph, contour, position, x, y, type, smooth, name, identifier)
+components(glyph, position, base, xScale, xyScale, yxScale, yScale, xOffset, yOffset, identifier)
+anchors(glyph, position, x, y, name, color, identifier)
+guidelines(glyph, position, x, y, angle, name, color, identifier)
+kerningPairs(side1, side2, value)
+groupMembers(name, position, glyph)
+
+The image and the lib of a glyph are stored as compact
+property lists. All other files are stored as bytes in
+the key/value table of SqliteFileSystem.
+
+Glyphs are read into and written from glyph objects.
+GLIF trees and GLIF data are only built when they are
+requested through the XML based methods. Numbers are
+stored in columns without a type affinity so that
+integers and floats are returned unchanged.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from core.fileSystem import FileSystemError
+from core.glyphTree import readGlyphFromTree, writeGlyphToTree, _relaxedSetattr
+from core.glyphString import readGlyphFromString, writeGlyphToString
+from core.plistString import readPlistFromString, writePlistToString
+from core.objects import Glyph
+from sqlite import SqliteFileSystem
+
+_schema = """
+CREATE TABLE IF NOT EXISTS layers(name TEXT PRIMARY KEY, storageName TEXT, position INTEGER);
+CREATE TABLE IF NOT EXISTS glyphs(id INTEGER PRIMARY KEY, layer TEXT, name TEXT, width, height, note TEXT, image BLOB, lib BLOB, UNIQUE(layer, name));
+CREATE TABLE IF NOT EXISTS unicodes(glyph INTEGER, position INTEGER, code INTEGER);
+CREATE INDEX IF NOT EXISTS unicodesGlyph ON unicodes(glyph);
+CREATE INDEX IF NOT EXISTS unicodesCode ON unicodes(code);
+CREATE TABLE IF NOT EXISTS contours(glyph INTEGER, position INTEGER, identifier TEXT);
+CREATE INDEX IF NOT EXISTS contoursGlyph ON contours(glyph);
+CREATE TABLE IF NOT EXISTS points(glyph INTEGER, contour INTEGER, position INTEGER, x, y, type TEXT, smooth INTEGER, name TEXT, identifier TEXT);
+CREATE INDEX IF NOT EXISTS pointsGlyph ON points(glyph);
+CREATE TABLE IF NOT EXISTS components(glyph INTEGER, position INTEGER, base TEXT, xScale, xyScale, yxScale, yScale, xOffset, yOffset, identifier TEXT);
+CREATE INDEX IF NOT EXISTS componentsGlyph ON components(glyph);
+CREATE INDEX IF NOT EXISTS componentsBase ON components(base);
+CREATE TABLE IF NOT EXISTS anchors(glyph INTEGER, position INTEGER, x, y, name TEXT, color TEXT, identifier TEXT);
+CREATE INDEX IF NOT EXISTS anchorsGlyph ON anchors(glyph);
+CREATE TABLE IF NOT EXISTS guidelines(glyph INTEGER, position INTEGER, x, y, angle, name TEXT, color TEXT, identifier TEXT);
+CREATE INDEX IF NOT EXISTS guidelinesGlyph ON guidelines(glyph);
+CREATE TABLE IF NOT EXISTS kerningPairs(side1 TEXT, side2 TEXT, value, PRIMARY KEY(side1, side2));
+CREATE TABLE IF NOT EXISTS groupMembers(name TEXT, position INTEGER, glyph TEXT);
+CREATE INDEX IF NOT EXISTS groupMembersName ON groupMembers(name);
+CREATE INDEX IF NOT EXISTS groupMembersGlyph ON groupMembers(glyph);
+"""
+
+# tables that are keyed by glyph id
+_glyphDataTables = "unicodes contours points components anchors guidelines".split(" ")
+
+_anchorAttributes = "x y name color identifier".split(" ")
+_guidelineAttributes = "x y angle name color identifier".split(" ")
+
+
+class SqliteTablesFileSystem(SqliteFileSystem):
+
+	storesGlyphObjects = True
+
+	def __init__(self, path, compact=None, profile=None):
+		super(SqliteTablesFileSystem, self).__init__(path, compact=compact, profile=profile)
+		self.db.executescript(_schema)
+
+	# ---------------
+	# Top Level Files
+	# ---------------
+
+	def readGroups(self):
+		groups = {}
+		for name, glyphName in self.db.execute('SELECT name, glyph FROM groupMembers ORDER BY name, position'):
+			members = groups.setdefault(name, [])
+			# empty groups are stored with a NULL member
+			if glyphName is not None:
+				members.append(glyphName)
+		if not groups:
+			return None
+		return groups
+
+	def writeGroups(self, data):
+		rows = []
+		for name, members in data.items():
+			if not members:
+				rows.append((name, 0, None))
+			for position, glyphName in enumerate(members):
+				rows.append((name, position, glyphName))
+		self.db.execute('DELETE FROM groupMembers')
+		self.db.executemany('INSERT INTO groupMembers VALUES (?, ?, ?)', rows)
+
+	def readKerning(self):
+		kerning = {}
+		for side1, side2, value in self.db.execute('SELECT side1, side2, value FROM kerningPairs'):
+			if side1 not in kerning:
+				kerning[side1] = {}
+			kerning[side1][side2] = value
+		if not kerning:
+			return None
+		return kerning
+
+	def writeKerning(self, data):
+		rows = []
+		for side1, pairs in data.items():
+			for side2, value in pairs.items():
+				rows.append((side1, side2, value))
+		self.db.execute('DELETE FROM kerningPairs')
+		self.db.executemany('INSERT INTO kerningPairs VALUES (?, ?, ?)', rows)
+
+	# -----------------
+	# Layers and Glyphs
+	# -----------------
+
+	"""
+	layercontents.plist is stored in the layers table.
+	"""
+
+	def readLayerContents(self):
+		layerContents = OrderedDict()
+		for layerName, storageName in self.db.execute('SELECT name, storageName FROM layers ORDER BY position'):
+			layerContents[layerName] = storageName
+		return layerContents
+
+	def writeLayerContents(self):
+		if not self._layerStorageMappingChanged:
+			return
+		rows = [(layerName, storageName, position) for position, (layerName, storageName) in enumerate(self.getLayerStorageMapping().items())]
+		self.db.execute('DELETE FROM layers')
+		self.db.executemany('INSERT INTO layers VALUES (?, ?, ?)', rows)
+		self._layerStorageMappingChanged = False
+
+	"""
+	glyphs*/contents.plist is implied by the glyphs table.
+	"""
+
+	def readGlyphSetContents(self, layerName):
+		cursor = self.db.execute('SELECT name FROM glyphs WHERE layer=?', (layerName,))
+		return {glyphName : glyphName for glyphName, in cursor}
+
+	def writeGlyphSetContents(self, layerName):
+		pass
+
+	# glyph objects
+
+	def _getGlyphRow(self, layerName, glyphName, columns):
+		cursor = self.db.execute('SELECT id, %s FROM glyphs WHERE layer=? AND name=?' % ", ".join(columns), (layerName, glyphName))
+		return cursor.fetchone()
+
+	def readGlyphObject(self, layerName, glyphName, glyphObject, pointPen):
+		db = self.db
+		row = self._getGlyphRow(layerName, glyphName, ("name", "width", "height", "note", "image", "lib"))
+		if row is None:
+			raise FileSystemError("The glyph %s could not be read." % glyphName)
+		glyphId, name, width, height, note, image, lib = row
+		if glyphObject is not None:
+			_relaxedSetattr(glyphObject, "name", name)
+			_relaxedSetattr(glyphObject, "width", width)
+			_relaxedSetattr(glyphObject, "height", height)
+			if note is not None:
+				_relaxedSetattr(glyphObject, "note", note)
+			if image is not None:
+				_relaxedSetattr(glyphObject, "image", readPlistFromString(str(image)))
+			if lib is not None:
+				_relaxedSetattr(glyphObject, "lib", readPlistFromString(str(lib)))
+			unicodes = self._readUnicodes(glyphId)
+			if unicodes:
+				_relaxedSetattr(glyphObject, "unicodes", unicodes)
+			anchors = self._readAttributeRows("anchors", _anchorAttributes, glyphId)
+			if anchors:
+				_relaxedSetattr(glyphObject, "anchors", anchors)
+			guidelines = self._readAttributeRows("guidelines", _guidelineAttributes, glyphId)
+			if guidelines:
+				_relaxedSetattr(glyphObject, "guidelines", guidelines)
+		if pointPen is not None:
+			points = db.execute('SELECT contour, x, y, type, smooth, name, identifier FROM points WHERE glyph=? ORDER BY contour, position', (glyphId,)).fetchall()
+			pointIndex = 0
+			for contour, identifier in db.execute('SELECT position, identifier FROM contours WHERE glyph=? ORDER BY position', (glyphId,)).fetchall():
+				pointPen.beginPath(identifier=identifier)
+				while pointIndex < len(points) and points[pointIndex][0] == contour:
+					_, x, y, segmentType, smooth, name, pointIdentifier = points[pointIndex]
+					pointPen.addPoint((x, y), segmentType=segmentType, smooth=bool(smooth), name=name, identifier=pointIdentifier)
+					pointIndex += 1
+				pointPen.endPath()
+			for row in db.execute('SELECT base, xScale, xyScale, yxScale, yScale, xOffset, yOffset, identifier FROM components WHERE glyph=? ORDER BY position', (glyphId,)).fetchall():
+				pointPen.addComponent(row[0], tuple(row[1:7]), identifier=row[7])
+
+	def _readUnicodes(self, glyphId):
+		cursor = self.db.execute('SELECT code FROM unicodes WHERE glyph=? ORDER BY position', (glyphId,))
+		return [code for code, in cursor]
+
+	def _readAttributeRows(self, table, attributes, glyphId):
+		cursor = self.db.execute('SELECT %s FROM %s WHERE glyph=? ORDER BY position' % (", ".join(attributes), table), (glyphId,))
+		objects = []
+		for row in cursor:
+			# only the attributes that were defined are returned
+			objects.append({attr : value for attr, value in zip(attributes, row) if value is not None})
+		return objects
+
+	def readGlyphInfo(self, layerName, glyphName, fields):
+		columns = [field for field in fields if field in ("name", "width", "height", "note")]
+		row = self._getGlyphRow(layerName, glyphName, columns or ["name"])
+		if row is None:
+			raise FileSystemError("The glyph %s could not be read." % glyphName)
+		glyphId = row[0]
+		info = dict(zip(columns, row[1:]))
+		if "unicodes" in fields:
+			info["unicodes"] = self._readUnicodes(glyphId)
+		if "anchors" in fields:
+			info["anchors"] = self._readAttributeRows("anchors", _anchorAttributes, glyphId)
+		return info
+
+	def findGlyphs(self, layerName, query):
+		conditions = ["layer=?"]
+		values = [layerName]
+		if "unicodeRange" in query:
+			conditions.append("id IN (SELECT glyph FROM unicodes WHERE code BETWEEN ? AND ?)")
+			values.extend(query["unicodeRange"])
+		if "baseGlyph" in query:
+			conditions.append("id IN (SELECT glyph FROM components WHERE base=?)")
+			values.append(query["baseGlyph"])
+		if "anchorName" in query:
+			conditions.append("id IN (SELECT glyph FROM anchors WHERE name=?)")
+			values.append(query["anchorName"])
+		if "hasNote" in query:
+			if query["hasNote"]:
+				conditions.append("note IS NOT NULL")
+			else:
+				conditions.append("note IS NULL")
+		cursor = self.db.execute('SELECT name, lib FROM glyphs WHERE %s' % " AND ".join(conditions), values)
+		if "libKey" not in query:
+			return [glyphName for glyphName, lib in cursor]
+		# the lib is stored as a property list, so the
+		# key is looked up in the remaining glyphs
+		glyphNames = []
+		for glyphName, lib in cursor:
+			if lib is not None and query["libKey"] in readPlistFromString(str(lib)):
+				glyphNames.append(glyphName)
+		return glyphNames
+
+	def writeGlyphObject(self, layerName, glyphName, glyphObject):
+		db = self.db
+		# make sure that the layer is in the layer contents
+		self.getLayerStorageName(layerName)
+		image = lib = None
+		if glyphObject.image:
+			image = sqlite3.Binary(writePlistToString(glyphObject.image, header=None, compact=True))
+		if glyphObject.lib:
+			lib = sqlite3.Binary(writePlistToString(glyphObject.lib, header=None, compact=True))
+		values = (glyphObject.width, glyphObject.height, glyphObject.note or None, image, lib)
+		row = self._getGlyphRow(layerName, glyphName, ("name",))
+		if row is None:
+			cursor = db.execute('INSERT INTO glyphs(layer, name, width, height, note, image, lib) VALUES (?, ?, ?, ?, ?, ?, ?)', (layerName, glyphName) + values)
+			glyphId = cursor.lastrowid
+		else:
+			glyphId = row[0]
+			db.execute('UPDATE glyphs SET width=?, height=?, note=?, image=?, lib=? WHERE id=?', values + (glyphId,))
+			for table in _glyphDataTables:
+				db.execute('DELETE FROM %s WHERE glyph=?' % table, (glyphId,))
+		# unicodes
+		rows = [(glyphId, position, code) for position, code in enumerate(glyphObject.unicodes)]
+		db.executemany('INSERT INTO unicodes VALUES (?, ?, ?)', rows)
+		# contours
+		contourRows = []
+		pointRows = []
+		for contourIndex, contour in enumerate(glyphObject.contours):
+			contourRows.append((glyphId, contourIndex, contour.identifier))
+			for position, ((x, y), segmentType, smooth, name, identifier) in enumerate(contour):
+				pointRows.append((glyphId, contourIndex, position, x, y, segmentType, int(bool(smooth)), name, identifier))
+		db.executemany('INSERT INTO contours VALUES (?, ?, ?)', contourRows)
+		db.executemany('INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', pointRows)
+		# components
+		rows = []
+		for position, (baseGlyphName, transformation, identifier) in enumerate(glyphObject.components):
+			rows.append((glyphId, position, baseGlyphName) + tuple(transformation) + (identifier,))
+		db.executemany('INSERT INTO components VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+		# anchors and guidelines
+		for table, attributes, objects in (("anchors", _anchorAttributes, glyphObject.anchors), ("guidelines", _guidelineAttributes, glyphObject.guidelines)):
+			rows = []
+			for position, obj in enumerate(objects):
+				rows.append((glyphId, position) + tuple([obj.get(attr) for attr in attributes]))
+			db.executemany('INSERT INTO %s VALUES (%s)' % (table, ", ".join(["?"] * (len(attributes) + 2))), rows)
+		self.setGlyphStorageName(layerName, glyphName, glyphName)
+
+	def writeGlyphObjects(self, layerName, glyphs):
+		# write the entire batch in its own transaction
+		self.db.commit()
+		with self.db:
+			for glyphName, glyphObject in glyphs:
+				self.writeGlyphObject(layerName, glyphName, glyphObject)
+
+	# XML
+
+	"""
+	The XML based methods convert between glyph objects and
+	GLIF trees or GLIF data. Reading returns None for glyphs
+	that are not in the layer, as the other file systems do.
+	"""
+
+	def _readGlyphToObject(self, layerName, glyphName):
+		if self._getGlyphRow(layerName, glyphName, ("name",)) is None:
+			return None
+		glyph = Glyph()
+		self.readGlyphObject(layerName, glyphName, glyph, glyph)
+		return glyph
+
+	def readGlyph(self, layerName, glyphName):
+		glyph = self._readGlyphToObject(layerName, glyphName)
+		if glyph is None:
+			return None
+		return writeGlyphToTree(glyph)
+
+	def readGlyphBytes(self, layerName, glyphName):
+		glyph = self._readGlyphToObject(layerName, glyphName)
+		if glyph is None:
+			return None
+		return writeGlyphToString(glyph, compact=self.compact)
+
+	def readGlyphsBytes(self, layerName, glyphNames):
+		for glyphName in glyphNames:
+			yield glyphName, self.readGlyphBytes(layerName, glyphName)
+
+	def writeGlyph(self, layerName, glyphName, tree):
+		glyph = Glyph()
+		readGlyphFromTree(tree, glyph, glyph)
+		self.writeGlyphObject(layerName, glyphName, glyph)
+
+	def writeGlyphBytes(self, layerName, glyphName, data):
+		self.writeGlyphObject(layerName, glyphName, _glyphFromString(data))
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		self.writeGlyphObjects(layerName, [(glyphName, _glyphFromString(data)) for glyphName, data in glyphs])
+
+
+def _glyphFromString(data):
+	glyph = Glyph()
+	readGlyphFromString(data, glyph, glyph)
+	return glyph
+
+
+if __name__ == "__main__":
+	from core.fileSystem import debugWriteFont, debugReadFont, debugRoundTripFont
+	debugWriteFont(SqliteTablesFileSystem)
+	debugReadFont(SqliteTablesFileSystem)
+	diffs = debugRoundTripFont(SqliteTablesFileSystem)
+	if diffs:
+		print diffs
@@ -1,7 +1,11 @@
+import gc
+import multiprocessing
 import os
 import shutil
+import sys
 import tempfile
 import time
+import types
 from core.ufoReaderWriter import UFOReaderWriter
 from core.fonts import compileFont
 from core.objects import Font
@@ -24,6 +28,40 @@ fileSystems["UFO 3 Zipped"] = UFO3ZipFileSystem
 from sqlite import SqliteFileSystem
 fileSystems["Flat SQLite DB"] = SqliteFileSystem
 
+from sqliteTables import SqliteTablesFileSystem
+fileSystems["SQLite Tables"] = SqliteTablesFileSystem
+
+from ufo3flat import UFO3FlatFileSystem
+fileSystems["UFO 3 Flat Layers"] = UFO3FlatFileSystem
+
+from ufo3chunk import UFO3ChunkFileSystem
+fileSystems["UFO 3 Chunked"] = UFO3ChunkFileSystem
+
+from ufo3chunkzip import UFO3ZipChunkFileSystem
+fileSystems["UFO 3 Chunked Zipped"] = UFO3ZipChunkFileSystem
+
+# File system options are stored as lists of keyword
+# arguments for the file system class. Each will be
+# tested as a separate variant of the file system:
+# "file system name" : [
+#     {option name : value},
+# ]
+
+chunkSizes = [10, 50, 100, 250]
+
+fileSystemOptions = {
+	"Single XML" : [dict(), dict(lazy=True)],
+	"UFO 3 Chunked" : [dict(chunkSize=chunkSize) for chunkSize in chunkSizes],
+	"UFO 3 Chunked Zipped" : [dict(chunkSize=chunkSize) for chunkSize in chunkSizes],
+}
+
+# The SQLite pragma profiles are only compared by
+# the tests that are affected by them.
+
+sqliteProfileOptions = {
+	"Flat SQLite DB" : [dict(profile=profile) for profile in sorted(SqliteFileSystem.profiles.keys())],
+}
+
 # ----------
 # Test Fonts
 # ----------
@@ -43,10 +81,6 @@ Needed Tests
 - Remove glyphs.
   This will require a BaseFileSystem modification.
   Something like removeBytesFromLocation.
-- Test memory usage of the file system after a full read.
-  sys.getsizeof will give some info. It won't be perfect
-  but it will still be useful to see the values.
-- Retrieve a cmap for each layer.
 """
 
 tests = {}
@@ -57,14 +91,28 @@ tests = {}
 #     reading : bool indicating if the function reads a file,
 #     writing : bool indicating if the function writes a file,
 #     time : bool indicating if the function should be timed (optional, default is False),
+#     compare : list of (label, file system keyword arguments) that will be
+#         run and reported side by side (optional, default is None),
+#     fileSystemOptions : dict of file system options, in the same form as
+#         fileSystemOptions, that replace the global options for this test
+#         (optional, default is None),
+#     fileSystems : list of the names of the file systems that the test
+#         is run with (optional, default is None, meaning all file systems),
 # }
 
+# Output modes compared by the tests that write files.
 
-def testFileSize(fileSystem=None, font=None, path=None, **kwargs):
+outputModes = [
+	("pretty", dict()),
+	("compact", dict(compact=True)),
+]
+
+
+def testFileSize(fileSystem=None, font=None, path=None, glyphSetMetadata=False, **kwargs):
 	"""
 	Test the resulting size of a written file.
 	"""
-	writer = UFOReaderWriter(fileSystem)
+	writer = UFOReaderWriter(fileSystem, glyphSetMetadata=glyphSetMetadata)
 	writer.writeMetaInfo()
 	writer.writeInfo(font.info)
 	writer.writeGroups(font.groups)
@@ -72,9 +120,8 @@ def testFileSize(fileSystem=None, font=None, path=None, **kwargs):
 	writer.writeLib(font.lib)
 	writer.writeFeatures(font.features)
 	for layerName, layer in font.layers.items():
-		for glyph in layer:
-			glyphName = glyph.name
-			writer.writeGlyph(layerName, glyphName, glyph)
+		glyphs = [(glyph.name, glyph) for glyph in layer]
+		writer.writeGlyphs(layerName, glyphs)
 		writer.writeGlyphSetContents(layerName)
 	writer.writeLayerContents()
 	writer.close()
@@ -96,14 +143,29 @@ def _getFileSize(path):
 tests["File Size"] = dict(
 	function=testFileSize,
 	reading=False,
-	writing=True
+	writing=True,
+	compare=outputModes
 )
 
-def testFullWrite(fileSystem=None, font=None, **kwargs):
+def testFileSizeWithMetadata(fileSystem=None, font=None, path=None, **kwargs):
+	"""
+	Test the resulting size of a written file
+	that includes the glyph set metadata.
+	"""
+	return testFileSize(fileSystem=fileSystem, font=font, path=path, glyphSetMetadata=True)
+
+tests["File Size With Glyph Set Metadata"] = dict(
+	function=testFileSizeWithMetadata,
+	reading=False,
+	writing=True,
+	compare=outputModes
+)
+
+def testFullWrite(fileSystem=None, font=None, glyphSetMetadata=False, **kwargs):
 	"""
 	Fully write a new font.
 	"""
-	writer = UFOReaderWriter(fileSystem)
+	writer = UFOReaderWriter(fileSystem, glyphSetMetadata=glyphSetMetadata)
 	writer.writeMetaInfo()
 	writer.writeInfo(font.info)
 	writer.writeGroups(font.groups)
@@ -111,9 +173,8 @@ def testFullWrite(fileSystem=None, font=None, **kwargs):
 	writer.writeLib(font.lib)
 	writer.writeFeatures(font.features)
 	for layerName, layer in font.layers.items():
-		for glyph in layer:
-			glyphName = glyph.name
-			writer.writeGlyph(layerName, glyphName, glyph)
+		glyphs = [(glyph.name, glyph) for glyph in layer]
+		writer.writeGlyphs(layerName, glyphs)
 		writer.writeGlyphSetContents(layerName)
 	writer.writeLayerContents()
 	writer.close()
@@ -122,7 +183,23 @@ tests["Full Write"] = dict(
 	function=testFullWrite,
 	reading=False,
 	writing=True,
-	time=True
+	time=True,
+	compare=outputModes,
+	fileSystemOptions=sqliteProfileOptions
+)
+
+def testFullWriteWithMetadata(fileSystem=None, font=None, **kwargs):
+	"""
+	Fully write a new font and its glyph set metadata.
+	"""
+	testFullWrite(fileSystem=fileSystem, font=font, glyphSetMetadata=True)
+
+tests["Full Write With Glyph Set Metadata"] = dict(
+	function=testFullWriteWithMetadata,
+	reading=False,
+	writing=True,
+	time=True,
+	compare=outputModes
 )
 
 def testFullRead(fileSystem=None, font=None, **kwargs):
@@ -137,7 +214,7 @@ def testFullRead(fileSystem=None, font=None, **kwargs):
 	font.kerning = reader.readKerning()
 	font.lib = reader.readLib()
 	font.features = reader.readFeatures()
-	font.loadLayers(reader)
+	font.loadLayers(reader, loadGlyphs=True)
 	for layer in font.layers.values():
 		for glyph in layer:
 			pass
@@ -149,6 +226,97 @@ tests["Full Read"] = dict(
 	time=True
 )
 
+def testParallelFullRead(fileSystem=None, font=None, **kwargs):
+	"""
+	Fully load an entire font with the glyphs parsed
+	by one worker process per CPU. This is only faster
+	than Full Read if there is more than one CPU.
+	"""
+	font = Font()
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	reader.readInfo(font.info)
+	font.groups = reader.readGroups()
+	font.kerning = reader.readKerning()
+	font.lib = reader.readLib()
+	font.features = reader.readFeatures()
+	font.loadLayers(reader, loadGlyphs=True, processes=multiprocessing.cpu_count())
+	for layer in font.layers.values():
+		for glyph in layer:
+			pass
+
+tests["Parallel Full Read"] = dict(
+	function=testParallelFullRead,
+	reading=True,
+	writing=False,
+	time=True
+)
+
+def testCachedRead(fileSystem=None, font=None, **kwargs):
+	"""
+	Iterate over all glyphs in the font while keeping
+	at most 100 glyphs per layer in memory.
+	"""
+	font = Font()
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	font.loadLayers(reader, cacheSize=100)
+	for layer in font.layers.values():
+		for glyph in layer:
+			pass
+
+tests["Cached Read"] = dict(
+	function=testCachedRead,
+	reading=True,
+	writing=False,
+	time=True
+)
+
+def testFullReadMemory(fileSystem=None, font=None, **kwargs):
+	"""
+	Test the memory used by the font and the file
+	system after an entire font has been loaded.
+	"""
+	font = Font()
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	reader.readInfo(font.info)
+	font.groups = reader.readGroups()
+	font.kerning = reader.readKerning()
+	font.lib = reader.readLib()
+	font.features = reader.readFeatures()
+	font.loadLayers(reader, loadGlyphs=True)
+	size = _getObjectMemory(font)
+	size = "{:,d} bytes".format(size)
+	return size
+
+def _getObjectMemory(obj):
+	"""
+	Add the sys.getsizeof values of the object and
+	all of the objects that it references. Classes,
+	modules and functions are shared by everything,
+	so they are not counted.
+	"""
+	seen = set()
+	stack = [obj]
+	total = 0
+	while stack:
+		obj = stack.pop()
+		if id(obj) in seen or isinstance(obj, _sharedObjectTypes):
+			continue
+		seen.add(id(obj))
+		total += sys.getsizeof(obj)
+		stack.extend(gc.get_referents(obj))
+	return total
+
+_sharedObjectTypes = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+tests["Full Read Memory"] = dict(
+	function=testFullReadMemory,
+	reading=True,
+	writing=False
+)
+
 def testPartialRead(fileSystem=None, font=None, **kwargs):
 	"""
 	Load 25% of the glyphs in the font.
@@ -196,25 +364,127 @@ def testPartialWrite(fileSystem=None, font=None, **kwargs):
 		layer = font.layers[layerName]
 		glyph = layer[glyphName]
 		glyph.note = "partial modify"
-	# write
+	# write the modified glyphs
 	writer = reader
-	writer.writeMetaInfo()
-	for glyphName, layerName in glyphNames:
-		layer = font.layers[layerName]
-		glyph = layer[glyphName]
-		writer.writeGlyph(layerName, glyphName, glyph)
-	for layerName in font.layers.keys():
-		writer.writeGlyphSetContents(layerName)
-	writer.writeLayerContents()
+	font.save(writer)
 	writer.close()
 
 tests["Partial Write"] = dict(
 	function=testPartialWrite,
 	reading=True,
 	writing=False,
+	time=True,
+	fileSystemOptions=sqliteProfileOptions
+)
+
+def testCmap(fileSystem=None, font=None, **kwargs):
+	"""
+	Retrieve a cmap for each layer.
+	"""
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	cmaps = {}
+	for layerName in reader.getLayerNames():
+		cmap = cmaps[layerName] = {}
+		for glyphName in reader.getGlyphNames(layerName):
+			info = reader.readGlyphInfo(layerName, glyphName, fields=["unicodes"])
+			for code in info["unicodes"]:
+				cmap[code] = glyphName
+
+tests["Cmap Read"] = dict(
+	function=testCmap,
+	reading=True,
+	writing=False,
+	time=True
+)
+
+def testMetadataCmap(fileSystem=None, font=None, **kwargs):
+	"""
+	Retrieve a cmap for each layer from the glyph set metadata.
+	"""
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	cmaps = {}
+	for layerName in reader.getLayerNames():
+		cmap = cmaps[layerName] = {}
+		for glyphName, metadata in reader.readGlyphSetMetadata(layerName).items():
+			for code in metadata["unicodes"]:
+				cmap[code] = glyphName
+
+tests["Metadata Cmap Read"] = dict(
+	function=testMetadataCmap,
+	reading=True,
+	writing=False,
+	time=True
+)
+
+def testComponentReferences(fileSystem=None, font=None, **kwargs):
+	"""
+	Build the reverse component graph for each layer.
+	"""
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	for layerName in reader.getLayerNames():
+		reader.getComponentReferences(layerName)
+
+tests["Component References"] = dict(
+	function=testComponentReferences,
+	reading=True,
+	writing=False,
+	time=True
+)
+
+def testGlyphQuery(fileSystem=None, font=None, **kwargs):
+	"""
+	Find the glyphs with a unicode value in the Basic
+	Latin range and the glyphs with a note in each layer.
+	"""
+	reader = UFOReaderWriter(fileSystem)
+	reader.readMetaInfo()
+	for layerName in reader.getLayerNames():
+		reader.findGlyphs(layerName, unicodeRange=(0x0000, 0x007F))
+		reader.findGlyphs(layerName, hasNote=True)
+
+tests["Glyph Query"] = dict(
+	function=testGlyphQuery,
+	reading=True,
+	writing=False,
 	time=True
 )
 
+def testGlyphNameAllocation(fileSystem=None, **kwargs):
+	"""
+	Allocate storage names for 65,535 new glyphs. Most
+	of the names clash with other names when they are
+	converted to case-insensitive file names:
+
+		A1, a_1, a:1, a*1 ... -> a_1.glif
+		xxx...xxx7, xxx...xxx15 ... -> xxx...xxx.glif
+
+	The allocation is implemented by BaseFileSystem, so
+	this is only run with one file system.
+	"""
+	patterns = ["A%d", "a_%d", "a:%d", "a*%d", "a?%d", "a<%d", "a>%d"]
+	glyphNames = []
+	for i in range(65535):
+		if i % 8 == 7:
+			glyphNames.append("x" * 300 + str(i))
+		else:
+			glyphNames.append(patterns[i % 8] % (i // 8))
+	start = time.time()
+	for glyphName in glyphNames:
+		fileSystem.getGlyphStorageName("public.default", glyphName)
+	total = time.time() - start
+	fileSystem.close()
+	return total
+
+tests["Glyph Name Allocation"] = dict(
+	function=testGlyphNameAllocation,
+	reading=False,
+	writing=False,
+	fileSystems=["UFO 3"]
+)
+
 def testDropboxWrite(fileSystem=None, font=None, **kwargs):
 	"""
 	Upload the output of each fileSystem to your dropbox account
@@ -316,7 +586,9 @@ tests["Dropbox Write"] = dict(
 # -------
 
 def setupFile(font, fileSystem):
-	writer = UFOReaderWriter(fileSystem)
+	# the metadata is written so that the tests
+	# that use it do not have to rebuild it
+	writer = UFOReaderWriter(fileSystem, glyphSetMetadata=True)
 	writer.writeMetaInfo()
 	writer.writeInfo(font.info)
 	writer.writeGroups(font.groups)
@@ -324,13 +596,33 @@ def setupFile(font, fileSystem):
 	writer.writeLib(font.lib)
 	writer.writeFeatures(font.features)
 	for layerName, layer in font.layers.items():
-		for glyph in layer:
-			glyphName = glyph.name
-			writer.writeGlyph(layerName, glyphName, glyph)
+		glyphs = [(glyph.name, glyph) for glyph in layer]
+		writer.writeGlyphs(layerName, glyphs)
 		writer.writeGlyphSetContents(layerName)
 	writer.writeLayerContents()
 	writer.close()
 
+def getFileSystemVariants(fileSystemName, testData=None):
+	"""
+	Get a list of (variant name, keyword arguments)
+	for the given file system name. If the given test
+	data has file system options, they replace the
+	global options.
+	"""
+	options = fileSystemOptions.get(fileSystemName)
+	if testData is not None and testData.get("fileSystemOptions"):
+		options = testData["fileSystemOptions"].get(fileSystemName, options)
+	if not options:
+		return [(fileSystemName, {})]
+	variants = []
+	for kwargs in options:
+		variantName = fileSystemName
+		if kwargs:
+			description = ", ".join(["%s=%r" % (k, v) for k, v in sorted(kwargs.items())])
+			variantName = "%s (%s)" % (fileSystemName, description)
+		variants.append((variantName, kwargs))
+	return variants
+
 def tearDownFile(path):
 	if os.path.exists(path):
 		if os.path.isdir(path):
@@ -357,54 +649,76 @@ def execute():
 			font = compileFont(fontName)
 
 			for fileSystemName, fileSystemClass in sorted(fileSystems.items()):
-				path = tempfile.mkstemp(suffix=".%s" %fileSystemClass.fileExtension)[1]
-				tearDownFile(path)
-				reading = testData["reading"]
-				writing = testData["writing"]
-				# setup
-				if reading:
-					fs = fileSystemClass(path)
-					setupFile(font, fs)
-					del fs
-				# test
-				try:
-					func = testData["function"]
-					# timed
-					if testData.get("time", False):
-						times = []
-						for i in range(7):
-							start = time.time()
-							fileSystem = fileSystemClass(path)
-							func(
-								fileSystem=fileSystem,
-								font=font,
-								path=path
-							)
-							total = time.time() - start
-							times.append(total)
-							if not reading and writing:
-								tearDownFile(path)
-						times.sort()
-						times = times[1:-1]
-						result = sum(times) / 5.0
-					# other (function returns result)
-					else:
-						fileSystem = fileSystemClass(path)
-						result = func(
-							fileSystem=fileSystem,
-							font=font,
-							path=path
-						)
-						if not reading and writing:
-							tearDownFile(path)
-					print "%s:" % fileSystemName, result 
-				# tear down
-				except:
-					import traceback
-					print "%s: Oeps" % fileSystemName 
-					print traceback.format_exc(5)
-				finally:
+				if testData.get("fileSystems") is not None and fileSystemName not in testData["fileSystems"]:
+					continue
+				for variantName, options in getFileSystemVariants(fileSystemName, testData):
+					compare = testData.get("compare")
+					try:
+						if compare:
+							results = []
+							for label, compareOptions in compare:
+								kwargs = dict(options)
+								kwargs.update(compareOptions)
+								result = runTest(testData, font, fileSystemClass, kwargs)
+								results.append("%s %s" % (label, result))
+							result = ", ".join(results)
+						else:
+							result = runTest(testData, font, fileSystemClass, options)
+						print "%s:" % variantName, result
+					except:
+						import traceback
+						print "%s: Oeps" % variantName
+						print traceback.format_exc(5)
+
+def runTest(testData, font, fileSystemClass, options):
+	"""
+	Run a test with a file system created with the given
+	keyword arguments and return the result.
+	"""
+	path = tempfile.mkstemp(suffix=".%s" %fileSystemClass.fileExtension)[1]
+	tearDownFile(path)
+	reading = testData["reading"]
+	writing = testData["writing"]
+	# setup
+	if reading:
+		fs = fileSystemClass(path, **options)
+		setupFile(font, fs)
+		del fs
+	# test
+	try:
+		func = testData["function"]
+		# timed
+		if testData.get("time", False):
+			times = []
+			for i in range(7):
+				start = time.time()
+				fileSystem = fileSystemClass(path, **options)
+				func(
+					fileSystem=fileSystem,
+					font=font,
+					path=path
+				)
+				total = time.time() - start
+				times.append(total)
+				if not reading and writing:
 					tearDownFile(path)
+			times.sort()
+			times = times[1:-1]
+			result = sum(times) / 5.0
+		# other (function returns result)
+		else:
+			fileSystem = fileSystemClass(path, **options)
+			result = func(
+				fileSystem=fileSystem,
+				font=font,
+				path=path
+			)
+			if not reading and writing:
+				tearDownFile(path)
+		return result
+	# tear down
+	finally:
+		tearDownFile(path)
 
 if __name__ == "__main__":
 	execute()
@@ -13,8 +13,8 @@ class UFO3FileSystem(BaseFileSystem):
 
 	fileExtension = 'ufo'
 
-	def __init__(self, path):
-		super(UFO3FileSystem, self).__init__()
+	def __init__(self, path, compact=None):
+		super(UFO3FileSystem, self).__init__(compact=compact)
 		self.path = path
 		if not os.path.exists(self.path):
 			os.mkdir(path)
@@ -59,6 +59,21 @@ class UFO3FileSystem(BaseFileSystem):
 		f.write(data)
 		f.close()
 
+	# -----------------
+	# Layers and Glyphs
+	# -----------------
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		# create the layer directory once for the entire batch
+		directory = os.path.join(self.path, self.getLayerStorageName(layerName))
+		if not os.path.exists(directory):
+			os.mkdir(directory)
+		for glyphName, data in glyphs:
+			path = os.path.join(self.path, self.getGlyphLocation(layerName, glyphName))
+			f = open(path, "wb")
+			f.write(data)
+			f.close()
+
 
 if __name__ == "__main__":
 	from core.fileSystem import debugWriteFont, debugReadFont, debugRoundTripFont
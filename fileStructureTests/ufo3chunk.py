@@ -0,0 +1,254 @@
+"""
+UFO 3 Chunked File System
+-------------------------
+
+This implements an on-disk, uncompressed package
+structure. The top level files are identical to
+UFO 3, but the glyphs in each glyphs* directory are
+grouped into chunks of a fixed number of glyphs
+instead of being stored one glyph per file:
+
+glyphs/
+	chunks.plist
+		{
+			glyph name : [chunk name, offset, length]
+		}
+	chunk0.xml
+		<chunk>
+			<glyph name="text"> glif </glyph>
+		</chunk>
+	chunk1.xml
+	...
+
+The chunk size controls the trade off between the
+per file overhead of UFO 3 and the whole file rewrite
+of the single file structures. Reading a glyph loads
+(and caches) the chunk that contains it. Written glyphs
+are held in memory until the layer is flushed, at which
+point only the chunks containing written glyphs are
+rewritten. A layer is flushed when the glyph set
+contents are written or when the file system is closed.
+"""
+
+from collections import OrderedDict
+from core.fileSystem import BaseFileSystem
+from ufo3 import UFO3FileSystem
+
+chunkHeader = """
+<?xml version="1.0" encoding="UTF-8"?>
+<chunk>
+""".lstrip()
+
+chunkFooter = """
+</chunk>
+""".lstrip()
+
+class ChunkFileSystem(BaseFileSystem):
+
+	"""
+	This implements the chunked glyph storage on top of the
+	bytes <-> location methods. It does not store anything
+	by itself, so it must be combined with a file system
+	class that implements those methods:
+
+		class MyChunkFileSystem(ChunkFileSystem, MyFileSystem):
+			pass
+	"""
+
+	chunkSize = 100
+	chunkCacheSize = 16
+
+	def __init__(self, path, chunkSize=None, compact=None):
+		super(ChunkFileSystem, self).__init__(path, compact=compact)
+		if chunkSize is not None:
+			self.chunkSize = chunkSize
+		self._chunkIndexes = {}
+		self._chunkCache = OrderedDict()
+		self._glyphWrites = {}
+
+	def close(self):
+		for layerName in list(self._glyphWrites.keys()):
+			self._flushLayer(layerName)
+		self._chunkCache.clear()
+		super(ChunkFileSystem, self).close()
+
+	# -----------------
+	# Layers and Glyphs
+	# -----------------
+
+	# locations
+
+	def _getChunkIndexLocation(self, layerName):
+		layerDirectory = self.getLayerStorageName(layerName)
+		return self.joinLocations(layerDirectory, "chunks.plist")
+
+	def _getChunkLocation(self, layerName, chunkName):
+		layerDirectory = self.getLayerStorageName(layerName)
+		return self.joinLocations(layerDirectory, chunkName)
+
+	# index
+
+	def _getChunkIndex(self, layerName):
+		"""
+		Get the chunk index for the given layer name as an
+		OrderedDict of form:
+
+			{
+				glyph name : (chunk name, offset, length)
+			}
+
+		The glyphs are ordered by chunk and offset.
+		"""
+		if layerName not in self._chunkIndexes:
+			index = OrderedDict()
+			raw = self.readPlistFromLocation(self._getChunkIndexLocation(layerName))
+			if raw is not None:
+				for glyphName, (chunkName, offset, length) in sorted(raw.items(), key=lambda i: (_chunkNumber(i[1][0]), i[1][1])):
+					index[glyphName] = (chunkName, offset, length)
+			self._chunkIndexes[layerName] = index
+		return self._chunkIndexes[layerName]
+
+	# chunks
+
+	def _readChunk(self, layerName, chunkName):
+		"""
+		Read the bytes of a chunk. The most recently
+		used chunks are cached.
+		"""
+		key = (layerName, chunkName)
+		data = self._chunkCache.pop(key, None)
+		if data is None:
+			data = self.readBytesFromLocation(self._getChunkLocation(layerName, chunkName))
+			while len(self._chunkCache) >= self.chunkCacheSize:
+				self._chunkCache.popitem(last=False)
+		self._chunkCache[key] = data
+		return data
+
+	def _flushLayer(self, layerName):
+		"""
+		Rewrite the chunks that contain written glyphs
+		and the chunk index for the given layer name.
+		"""
+		pending = self._glyphWrites.pop(layerName, None)
+		if not pending:
+			return
+		index = self._getChunkIndex(layerName)
+		# group the existing glyphs by chunk
+		chunks = OrderedDict()
+		for glyphName, (chunkName, offset, length) in index.items():
+			if chunkName not in chunks:
+				chunks[chunkName] = []
+			chunks[chunkName].append(glyphName)
+		# find the affected chunks and place new glyphs
+		# in the last chunk until it is full
+		modified = set()
+		for glyphName in pending.keys():
+			if glyphName in index:
+				modified.add(index[glyphName][0])
+				continue
+			if not chunks or len(chunks[next(reversed(chunks))]) >= self.chunkSize:
+				chunkName = "chunk%d.xml" % len(chunks)
+				chunks[chunkName] = []
+			chunkName = next(reversed(chunks))
+			chunks[chunkName].append(glyphName)
+			modified.add(chunkName)
+		# rewrite the affected chunks
+		for chunkName in modified:
+			parts = [chunkHeader]
+			offset = len(chunkHeader)
+			locations = []
+			for glyphName in chunks[chunkName]:
+				data = pending.get(glyphName)
+				if data is None:
+					data = self.readGlyphBytes(layerName, glyphName)
+				locations.append((glyphName, (chunkName, offset, len(data))))
+				parts.append(data)
+				parts.append("\n")
+				offset += len(data) + 1
+			parts.append(chunkFooter)
+			data = "".join(parts)
+			self.writeBytesToLocation(data, self._getChunkLocation(layerName, chunkName))
+			self._chunkCache.pop((layerName, chunkName), None)
+			index.update(locations)
+		raw = {glyphName : list(location) for glyphName, location in index.items()}
+		self.writePlistToLocation(raw, self._getChunkIndexLocation(layerName))
+
+	# glyphs
+
+	"""
+	glyphs*/contents.plist is implied by the chunk index.
+	"""
+
+	def readGlyphSetContents(self, layerName):
+		index = self._getChunkIndex(layerName)
+		return {glyphName : glyphName for glyphName in index.keys()}
+
+	def writeGlyphSetContents(self, layerName):
+		self._flushLayer(layerName)
+
+	def readGlyph(self, layerName, glyphName):
+		data = self.readGlyphBytes(layerName, glyphName)
+		return self.convertBytesToTree(data)
+
+	def readGlyphBytes(self, layerName, glyphName):
+		pending = self._glyphWrites.get(layerName)
+		if pending is not None and glyphName in pending:
+			return pending[glyphName]
+		index = self._getChunkIndex(layerName)
+		if glyphName not in index:
+			return None
+		chunkName, offset, length = index[glyphName]
+		data = self._readChunk(layerName, chunkName)
+		return data[offset:offset + length]
+
+	def readGlyphsBytes(self, layerName, glyphNames):
+		# read the glyphs chunk by chunk
+		pending = self._glyphWrites.get(layerName, {})
+		index = self._getChunkIndex(layerName)
+		located = []
+		for glyphName in glyphNames:
+			if glyphName in pending:
+				yield glyphName, pending[glyphName]
+			elif glyphName in index:
+				chunkName, offset, length = index[glyphName]
+				located.append((_chunkNumber(chunkName), offset, length, chunkName, glyphName))
+			else:
+				yield glyphName, None
+		located.sort()
+		for chunkNumber, offset, length, chunkName, glyphName in located:
+			data = self._readChunk(layerName, chunkName)
+			yield glyphName, data[offset:offset + length]
+
+	def writeGlyph(self, layerName, glyphName, tree):
+		data = self.convertTreeToBytes(tree)
+		self.writeGlyphBytes(layerName, glyphName, data)
+
+	def writeGlyphBytes(self, layerName, glyphName, data):
+		if layerName not in self._glyphWrites:
+			self._glyphWrites[layerName] = OrderedDict()
+		self._glyphWrites[layerName][glyphName] = data
+		self.setGlyphStorageName(layerName, glyphName, glyphName)
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		# the glyphs are held in memory until the layer
+		# is flushed, so the batch needs no special handling
+		for glyphName, data in glyphs:
+			self.writeGlyphBytes(layerName, glyphName, data)
+
+
+def _chunkNumber(chunkName):
+	return int(chunkName[len("chunk"):-len(".xml")])
+
+
+class UFO3ChunkFileSystem(ChunkFileSystem, UFO3FileSystem):
+
+	fileExtension = 'ufo'
+
+
+if __name__ == "__main__":
+	from core.fileSystem import debugWriteFont, debugReadFont, debugRoundTripFont
+	debugWriteFont(UFO3ChunkFileSystem)
+	debugReadFont(UFO3ChunkFileSystem)
+	diffs = debugRoundTripFont(UFO3ChunkFileSystem)
+	if diffs:
+		print diffs
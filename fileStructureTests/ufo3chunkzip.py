@@ -0,0 +1,28 @@
+"""
+UFO 3 Chunked Zip File System
+-----------------------------
+
+This implements an on-disk, compressed (zip) package
+structure with the glyphs grouped into chunks. The
+structure is identical to the UFO 3 Chunked File System
+and each chunk is one member of the archive. Thus, a
+partial write only replaces the members of the chunks
+that contain written glyphs instead of one member
+per glyph.
+"""
+
+from ufo3zip import UFO3ZipFileSystem
+from ufo3chunk import ChunkFileSystem
+
+class UFO3ZipChunkFileSystem(ChunkFileSystem, UFO3ZipFileSystem):
+
+	fileExtension = 'ufoz'
+
+
+if __name__ == "__main__":
+	from core.fileSystem import debugWriteFont, debugReadFont, debugRoundTripFont
+	debugWriteFont(UFO3ZipChunkFileSystem)
+	debugReadFont(UFO3ZipChunkFileSystem)
+	diffs = debugRoundTripFont(UFO3ZipChunkFileSystem)
+	if diffs:
+		print diffs
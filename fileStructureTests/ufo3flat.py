@@ -0,0 +1,216 @@
+"""
+UFO 3 Flat Layers File System
+-----------------------------
+
+This implements an on-disk, uncompressed package
+structure. The top level files are identical to
+UFO 3, but each glyphs* directory is flattened into
+a single XML file and an index that maps glyph names
+to byte ranges in that file:
+
+glyphs.xml
+	<layer>
+		<glyph name="text"> glif </glyph>
+	</layer>
+glyphs.index.plist
+	{
+		glyph name : [offset, length]
+	}
+glyphs.metadata.plist
+
+The index allows a single glyph to be read by seeking
+directly to its byte range. Written glyphs are held
+in memory until the layer is flushed, which happens
+when the glyph set contents are written or when the
+file system is closed.
+"""
+
+import os
+from collections import OrderedDict
+from ufo3 import UFO3FileSystem
+
+layerHeader = """
+<?xml version="1.0" encoding="UTF-8"?>
+<layer>
+""".lstrip()
+
+layerFooter = """
+</layer>
+""".lstrip()
+
+class UFO3FlatFileSystem(UFO3FileSystem):
+
+	fileExtension = 'ufo'
+
+	def __init__(self, path, compact=None):
+		super(UFO3FlatFileSystem, self).__init__(path, compact=compact)
+		self._glyphIndexes = {}
+		self._glyphWrites = {}
+		self._layerFiles = {}
+
+	def close(self):
+		for layerName in list(self._glyphWrites.keys()):
+			self._flushLayer(layerName)
+		for layerName in list(self._layerFiles.keys()):
+			self._closeLayerFile(layerName)
+		super(UFO3FlatFileSystem, self).close()
+
+	# -----------------
+	# Layers and Glyphs
+	# -----------------
+
+	# locations
+
+	def _getLayerDataLocation(self, layerName):
+		return self.getLayerStorageName(layerName) + ".xml"
+
+	def _getLayerIndexLocation(self, layerName):
+		return self.getLayerStorageName(layerName) + ".index.plist"
+
+	def _getLayerMetadataLocation(self, layerName):
+		return self.getLayerStorageName(layerName) + ".metadata.plist"
+
+	# index
+
+	def _getGlyphIndex(self, layerName):
+		"""
+		Get the index for the given layer name as an
+		OrderedDict of form:
+
+			{
+				glyph name : (offset, length)
+			}
+
+		The glyphs are ordered as they are in the layer file.
+		"""
+		if layerName not in self._glyphIndexes:
+			index = OrderedDict()
+			raw = self.readPlistFromLocation(self._getLayerIndexLocation(layerName))
+			if raw is not None:
+				for glyphName, (offset, length) in sorted(raw.items(), key=lambda i: i[1][0]):
+					index[glyphName] = (offset, length)
+			self._glyphIndexes[layerName] = index
+		return self._glyphIndexes[layerName]
+
+	# layer file
+
+	def _getLayerFile(self, layerName):
+		f = self._layerFiles.get(layerName)
+		if f is None:
+			path = os.path.join(self.path, self._getLayerDataLocation(layerName))
+			f = open(path, "rb")
+			self._layerFiles[layerName] = f
+		return f
+
+	def _closeLayerFile(self, layerName):
+		f = self._layerFiles.pop(layerName, None)
+		if f is not None:
+			f.close()
+
+	def _flushLayer(self, layerName):
+		"""
+		Rewrite the layer file and the index for the given
+		layer name. Glyphs that have not been written are
+		copied from the existing layer file.
+		"""
+		pending = self._glyphWrites.pop(layerName, None)
+		if not pending:
+			return
+		index = self._getGlyphIndex(layerName)
+		glyphNames = list(index.keys()) + [glyphName for glyphName in pending.keys() if glyphName not in index]
+		newIndex = OrderedDict()
+		parts = [layerHeader]
+		offset = len(layerHeader)
+		for glyphName in glyphNames:
+			data = pending.get(glyphName)
+			if data is None:
+				data = self.readGlyphBytes(layerName, glyphName)
+			newIndex[glyphName] = (offset, len(data))
+			parts.append(data)
+			parts.append("\n")
+			offset += len(data) + 1
+		parts.append(layerFooter)
+		self._closeLayerFile(layerName)
+		self.writeBytesToLocation("".join(parts), self._getLayerDataLocation(layerName))
+		raw = {glyphName : [offset, length] for glyphName, (offset, length) in newIndex.items()}
+		self.writePlistToLocation(raw, self._getLayerIndexLocation(layerName))
+		self._glyphIndexes[layerName] = newIndex
+
+	# glyphs
+
+	"""
+	glyphs*/contents.plist is implied by the index.
+	"""
+
+	def readGlyphSetContents(self, layerName):
+		index = self._getGlyphIndex(layerName)
+		return {glyphName : glyphName for glyphName in index.keys()}
+
+	def writeGlyphSetContents(self, layerName):
+		self._flushLayer(layerName)
+
+	def readGlyphSetMetadata(self, layerName):
+		return self.readPlistFromLocation(self._getLayerMetadataLocation(layerName))
+
+	def writeGlyphSetMetadata(self, layerName, data):
+		self.writePlistToLocation(data, self._getLayerMetadataLocation(layerName))
+
+	def readGlyph(self, layerName, glyphName):
+		data = self.readGlyphBytes(layerName, glyphName)
+		return self.convertBytesToTree(data)
+
+	def readGlyphBytes(self, layerName, glyphName):
+		pending = self._glyphWrites.get(layerName)
+		if pending is not None and glyphName in pending:
+			return pending[glyphName]
+		index = self._getGlyphIndex(layerName)
+		if glyphName not in index:
+			return None
+		offset, length = index[glyphName]
+		f = self._getLayerFile(layerName)
+		f.seek(offset)
+		return f.read(length)
+
+	def readGlyphsBytes(self, layerName, glyphNames):
+		# read the glyphs in the order they are in the layer file
+		pending = self._glyphWrites.get(layerName, {})
+		index = self._getGlyphIndex(layerName)
+		located = []
+		for glyphName in glyphNames:
+			if glyphName in pending:
+				yield glyphName, pending[glyphName]
+			elif glyphName in index:
+				located.append((index[glyphName], glyphName))
+			else:
+				yield glyphName, None
+		if located:
+			located.sort()
+			f = self._getLayerFile(layerName)
+			for (offset, length), glyphName in located:
+				f.seek(offset)
+				yield glyphName, f.read(length)
+
+	def writeGlyph(self, layerName, glyphName, tree):
+		data = self.convertTreeToBytes(tree)
+		self.writeGlyphBytes(layerName, glyphName, data)
+
+	def writeGlyphBytes(self, layerName, glyphName, data):
+		if layerName not in self._glyphWrites:
+			self._glyphWrites[layerName] = OrderedDict()
+		self._glyphWrites[layerName][glyphName] = data
+		self.setGlyphStorageName(layerName, glyphName, glyphName)
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		# the glyphs are held in memory until the layer
+		# is flushed, so the batch needs no special handling
+		for glyphName, data in glyphs:
+			self.writeGlyphBytes(layerName, glyphName, data)
+
+
+if __name__ == "__main__":
+	from core.fileSystem import debugWriteFont, debugReadFont, debugRoundTripFont
+	debugWriteFont(UFO3FlatFileSystem)
+	debugReadFont(UFO3FlatFileSystem)
+	diffs = debugRoundTripFont(UFO3FlatFileSystem)
+	if diffs:
+		print diffs
@@ -7,6 +7,7 @@ structure.
 """
 
 import os
+import time
 import tempfile
 import shutil
 import zipfile
@@ -17,8 +18,8 @@ class UFO3ZipFileSystem(BaseFileSystem):
 
 	fileExtension = 'ufoz'
 
-	def __init__(self, path):
-		super(UFO3ZipFileSystem, self).__init__()
+	def __init__(self, path, compact=None):
+		super(UFO3ZipFileSystem, self).__init__(compact=compact)
 		self.needFileWrite = False
 		self.path = path
 		# first being lazy and allow to the archive to append files
@@ -65,6 +66,35 @@ class UFO3ZipFileSystem(BaseFileSystem):
 	def writeBytesToLocation(self, data, location):
 		self.zip.writestr(location, data, compress_type=zipfile.ZIP_DEFLATED)
 
+	# -----------------
+	# Layers and Glyphs
+	# -----------------
+
+	def writeGlyphsBytes(self, layerName, glyphs):
+		# each member needs its own deflate stream, but
+		# the member settings are only created once
+		dateTime = time.localtime(time.time())[:6]
+		for glyphName, data in glyphs:
+			info = zipfile.ZipInfo(self.getGlyphLocation(layerName, glyphName), dateTime)
+			info.compress_type = zipfile.ZIP_DEFLATED
+			info.external_attr = 0600 << 16
+			self.zip.writestr(info, data)
+
+	def readGlyphsBytes(self, layerName, glyphNames):
+		# read the members in the order they are in the archive
+		members = []
+		for glyphName in glyphNames:
+			location = self.getGlyphLocation(layerName, glyphName)
+			try:
+				info = self.zip.getinfo(location)
+			except KeyError:
+				yield glyphName, None
+				continue
+			members.append((info, glyphName))
+		members.sort(key=lambda member: member[0].header_offset)
+		for info, glyphName in members:
+			yield glyphName, self.zip.read(info)
+
 
 
 if __name__ == "__main__":